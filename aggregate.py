@@ -0,0 +1,43 @@
+from collections import defaultdict
+
+class BoardAggregate():
+    #every counter, isk sum and day bucket the board pages show, computed in one scan.
+    #views maps a view name to a predicate picking which killmails land in its day buckets.
+    #killmails narrows the scan to part of history (e.g. one character's index entry)
+    def __init__(self, history, views, format_date, killmails=None):
+        self.history = history
+        self.version = history.version
+        self.counts = defaultdict(int) #row_type -> number of mails
+        self.sums = defaultdict(int)   #row_type -> summed zkb totalValue
+        view_days = {name: defaultdict(list) for name in views}
+        view_predicates = list(views.items())
+        for mail in (history if killmails == None else killmails):
+            row_type = mail.get('row_type')
+            self.counts[row_type] += 1
+            self.sums[row_type] += mail.get('zkb', {}).get('totalValue', 0)
+            day = mail['killmail_time'][0:10]
+            for name, predicate in view_predicates:
+                if predicate(mail):
+                    view_days[name][day].append(mail)
+        self.days = {}
+        for name, days in view_days.items():
+            result = []
+            for day in sorted(days.keys(), reverse=True):
+                reversed_killmails = sorted(days[day], key=lambda x: x['minutes_into_day'], reverse=True)
+                result.append((day, format_date(day), reversed_killmails))
+            self.days[name] = result
+
+    def is_current(self, history):
+        return history is self.history and history.version == self.version
+
+    def count(self, row_type):
+        return self.counts[row_type]
+
+    def isk(self, row_type):
+        #friendly fire is both a kill and a loss, so it is added to either total
+        if row_type == 'row-friendly_fire':
+            return self.sums[row_type]
+        return self.sums[row_type] + self.sums['row-friendly_fire']
+
+    def kills_by_date(self, view):
+        return self.days[view]
@@ -0,0 +1,109 @@
+import numpy as np
+
+from compact import ROW_TYPES
+
+KILL, LOSS, FRIENDLY_FIRE = range(len(ROW_TYPES))
+ROLLING_WEEKS = 4
+
+class BoardAnalytics():
+    #the stats page numbers. history is copied into numpy columns once and every
+    #table below is a group-by or time bucket over those columns, no python loops per mail.
+    #friendly fire counts as both a kill and a loss, the same as BoardAggregate.isk
+    def __init__(self, history, our_ids):
+        self.history = history
+        self.version = history.version
+        rows, days, values, systems, ships = [], [], [], [], []
+        pilot_rows, pilot_ids = [], []
+        self.system_names = {}
+        self.ship_names = {}
+        for mail in history:
+            row_type = mail.get('row_type')
+            if row_type not in ROW_TYPES:
+                continue
+            index = len(rows)
+            rows.append(ROW_TYPES.index(row_type))
+            days.append(mail['killmail_time'][0:10])
+            values.append(mail.get('zkb', {}).get('totalValue', 0))
+            systems.append(mail.get('solar_system_id', 0))
+            self.system_names.setdefault(mail.get('solar_system_id', 0), mail.get('solar_system_name'))
+            victim = mail.get('victim', {})
+            ships.append(victim.get('ship_type_id', 0))
+            self.ship_names.setdefault(victim.get('ship_type_id', 0), victim.get('ship_type_name'))
+            for attacker in mail.get('attackers', []):
+                if attacker.get('character_id') in our_ids:
+                    pilot_rows.append(index)
+                    pilot_ids.append(attacker['character_id'])
+        self.row = np.array(rows, dtype=np.int8)
+        self.day = np.array(days, dtype='datetime64[D]')
+        self.value = np.array(values, dtype=np.float64)
+        self.system = np.array(systems, dtype=np.int64)
+        self.ship = np.array(ships, dtype=np.int64)
+        self.pilot_row = np.array(pilot_rows, dtype=np.int64)
+        self.pilot_id = np.array(pilot_ids, dtype=np.int64)
+        self.killed = (self.row == KILL) | (self.row == FRIENDLY_FIRE)
+        self.lost = (self.row == LOSS) | (self.row == FRIENDLY_FIRE)
+
+    def is_current(self, history):
+        return history is self.history and history.version == self.version
+
+    def isk_over_time(self, period):
+        #[(bucket start, isk killed, isk lost, rolling killed, rolling lost)] newest first.
+        #every bucket between the first and last kill is listed, empty ones as zero.
+        #rolling sums cover the last ROLLING_WEEKS buckets for weeks, the bucket itself for months
+        if len(self.day) == 0:
+            return []
+        if period == 'week':
+            #numpy weeks start on thursday, shift to the monday on or before each day
+            weekday = (self.day.astype(np.int64) + 3) % 7
+            starts = self.day - weekday.astype('timedelta64[D]')
+            step = np.timedelta64(7, 'D')
+            window = ROLLING_WEEKS
+        else:
+            starts = self.day.astype('datetime64[M]')
+            step = np.timedelta64(1, 'M')
+            window = 1
+        first = starts.min()
+        bucket = ((starts - first) // step).astype(np.int64)
+        size = int(bucket.max()) + 1
+        killed = np.bincount(bucket, weights=np.where(self.killed, self.value, 0), minlength=size)
+        lost = np.bincount(bucket, weights=np.where(self.lost, self.value, 0), minlength=size)
+        labels = first + np.arange(size) * step
+        return list(zip(labels.astype(str).tolist(), killed.tolist(), lost.tolist(),
+                        rolling_sum(killed, window).tolist(), rolling_sum(lost, window).tolist()))[::-1]
+
+    def top_systems(self, limit=10):
+        #[(system id, name, mails, isk killed, isk lost)] busiest systems first
+        ids, inverse = np.unique(self.system, return_inverse=True)
+        mails = np.bincount(inverse, minlength=len(ids))
+        killed = np.bincount(inverse, weights=np.where(self.killed, self.value, 0), minlength=len(ids))
+        lost = np.bincount(inverse, weights=np.where(self.lost, self.value, 0), minlength=len(ids))
+        order = np.lexsort((-(killed + lost), -mails))[:limit]
+        return [(int(ids[i]), self.system_names.get(int(ids[i])), int(mails[i]), float(killed[i]), float(lost[i])) for i in order]
+
+    def top_victim_ships(self, limit=10):
+        #[(ship type id, name, kills, isk killed)] for the hulls we destroyed most
+        ships = self.ship[self.killed]
+        ids, inverse = np.unique(ships, return_inverse=True)
+        kills = np.bincount(inverse, minlength=len(ids))
+        killed = np.bincount(inverse, weights=self.value[self.killed], minlength=len(ids))
+        order = np.lexsort((-killed, -kills))[:limit]
+        return [(int(ids[i]), self.ship_names.get(int(ids[i])), int(kills[i]), float(killed[i])) for i in order]
+
+    def pilot_participation(self):
+        #{character id: (kills on the mail, share of all kills, isk killed)} for our characters
+        on_kill = self.killed[self.pilot_row]
+        pilots = self.pilot_id[on_kill]
+        rows = self.pilot_row[on_kill]
+        #a pilot is listed once per mail even if the final blow is also in the attacker list
+        pairs = np.unique(np.stack((pilots, rows)), axis=1)
+        ids, inverse = np.unique(pairs[0], return_inverse=True)
+        kills = np.bincount(inverse, minlength=len(ids))
+        killed = np.bincount(inverse, weights=self.value[pairs[1]], minlength=len(ids))
+        total = max(int(self.killed.sum()), 1)
+        return {int(ids[i]): (int(kills[i]), float(kills[i] / total), float(killed[i])) for i in range(len(ids))}
+
+def rolling_sum(values, window):
+    #sum of each bucket and the window-1 buckets before it
+    totals = np.cumsum(values)
+    totals[window:] = totals[window:] - totals[:-window]
+    return totals
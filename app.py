@@ -1,16 +1,36 @@
+import os
 import sys
+import copy
 import json
+import multiprocessing
 import logging
-import requests
+import mimetypes
+import pickle
+import signal
 import time
+import warnings
 from datetime import datetime
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from cachecontrol import CacheControl
-from cachecontrol.caches.file_cache import FileCache
 
-from flask import Flask, render_template
-from flask_frozen import Freezer
+from flask import Flask, Response, render_template, stream_template, abort
+from flask_frozen import Freezer, MissingURLGeneratorWarning
+from jinja2 import pass_context
+
+from killstore import KillmailStore
+from sqlstore import SqliteStore, LOOKUP_TABLES
+from aggregate import BoardAggregate
+from analytics import BoardAnalytics, ROLLING_WEEKS
+from views import load_views
+from fragments import FragmentCache, write_if_changed
+from ingest import parse_killmail, prune_killmail
+from killfeed import KillFeed, involves, REDISQ_URL
+from shared import SharedResources
+from sde import StaticData
+from snapshot import Snapshot, write_snapshot, fingerprint
+from shards import DataAPI, StaticAssets
+
+log = logging.getLogger('polyhedra')
 
 #global zKill instance for other pages
 g_zKill = None
@@ -19,241 +39,464 @@ app = Flask(__name__)
 freezer = Freezer(app)
 app.config['FREEZER_DESTINATION'] = 'out/build'
 app.config['FREEZER_RELATIVE_URLS'] = True
+#freezes only the pages handed to refreeze(): no static files, no routes without
+#arguments and no following the url_for links of the pages it builds
+page_freezer = Freezer(app, with_static_files=False, with_no_argument_rules=False, log_url_for=False)
+app.config['DATA_API'] = False # also freeze the month shards and the client rendered board, see enable_data_api()
+
+#totals every board shows next to its killmails
+TOTAL_KEYS = ('kills', 'losses', 'friendly_fire', 'money_killed', 'money_lost')
+
+#hashed copies of static/, built on first use
+g_assets = None
+
+#every board of a multi-board build, for the freeze workers (freeze_boards)
+g_boards = []
+
+#what loading a snapshot section can raise when the classes it was pickled from have changed
+SNAPSHOT_ERRORS = (pickle.UnpicklingError, AttributeError, ImportError, EOFError, TypeError, ValueError, KeyError)
+
+#per-mail processing stages, run in order by zKillAPI.stage_<name>. each mail is stamped
+#with the version of every stage it went through: bump a version when that stage's logic
+#changes and stored mails are sent back through it (and the stages after it) on the next build
+PIPELINE_STAGES = (('prune',        1),
+                   ('involved',     1),
+                   ('row_type',     1),
+                   ('formatted',    1),
+                   ('solar_system', 1),
+                   ('ship_type',    1))
+
+#where zkill and esi are reached, overridable so a local stand-in can be used (see bench/)
+ZKILL_API = 'http://zkillboard.com/api/'
+ESI_API = 'https://esi.evetech.net/latest/'
+
+MONTH_NAMES = ['','January', 'February', 'March', 'April', 'May', \
+    'June', 'July', 'August', 'September', 'October', 'November', \
+    'December']
 
 class zKillAPI():
-    def __init__(self, do_file_cache, zkill_calls):
+    def __init__(self, do_file_cache, zkill_calls, full_crawl=False, workers=8, use_sqlite=False, json_export=False,
+                 data_dir='data', out_dir='out/data', zkill_api=ZKILL_API, esi_api=ESI_API, shared=None):
         self.do_file_cache = do_file_cache
-        if self.do_file_cache:
-            self.cached_sess = CacheControl(requests.Session(), cache_etags=False, cache=FileCache('.web_cache'))
-            self.last_call_cache_hit = True
         self.zkill_calls = zkill_calls
+        self.full_crawl = full_crawl
+        self.workers = workers
+        self.json_export = json_export
+        self.snapshot = None
+        self.saved_lookup_sizes = {} # lookup -> size when last loaded or saved, see unsaved_changes()
+        self.data_dir = data_dir # characters and views, checked into the repo
+        self.out_dir = out_dir # history, lookups and caches carried between builds
+        self.snapshot_path = self.out_dir+'/state.snapshot' # local only, never in git
+        self.zkill_api = zkill_api
+        self.esi_api = esi_api
+        #session, rate limits and metrics, shared with the other boards of a multi-board build
+        self.shared = shared if shared != None else SharedResources(do_file_cache, workers)
+        self.zkill_bucket = self.shared.zkill_bucket
+        self.esi_bucket = self.shared.esi_bucket
+        self.esi_error_limit = self.shared.esi_error_limit
+        self.metrics = self.shared.metrics
+        self.http = self.shared.http
         self.character_list = {}
         self.reverse_character_list = {}
-        self.history = {}
-        self.most_recent_killID = 0
+        self.history = KillmailStore()
+        self.most_recent_killID = {}
         self.board_name = 'Polyhedra'
+        self.front_page_days = 14 # day blocks on a board's front page, older ones are in the monthly archive
+        self.aggregate_cache = None
+        self.character_aggregates = {}
+        self.analytics_cache = None
+        self.data_api_cache = None
 
-        with open('data/characters.json', 'r') as fd:
+        with open(self.data_dir+'/characters.json', 'r') as fd:
             self.character_list = json.load(fd)
 
         for name in self.character_list:
             self.reverse_character_list[str(self.character_list[name])] = name
+        self.our_ids = frozenset(self.character_list.values())
 
-        with open('data/pod_alliances.json', 'r') as fd:
-            self.pod_alliances = json.load(fd)
+        #board views and their compiled filters
+        self.views = load_views(self.data_dir, self.character_list)
 
-        with open('data/target_alliances.json', 'r') as fd:
-            self.target_alliances = json.load(fd)
+        #load current history and lookup tables
+        self.sqlite = None
+        if use_sqlite:
+            self.sqlite = SqliteStore(self.out_dir+'/board.sqlite')
+            if self.sqlite.is_empty():
+                self.sqlite.import_json(self.out_dir) # first sqlite run, migrate the json files
+        #the last build's processed state, its lookup tables are only unpickled once used (__getattr__)
+        self.snapshot = self.load_snapshot()
+        if self.snapshot != None:
+            self.history = self.snapshot.load('history')
+            self.most_recent_killID = self.snapshot.load('zkill_progress')
+            self.history.dirty.clear() # what it was saved to already has everything
+        elif self.sqlite:
+            self.history = KillmailStore(self.sqlite.load_killmails(), self.character_list, PIPELINE_STAGES)
+            for lookup in LOOKUP_TABLES:
+                setattr(self, lookup, self.sqlite.load_lookup(lookup))
+            self.most_recent_killID = self.load_json_file(self.out_dir+'/zkill_progress.json', {})
+        else:
+            self.history = KillmailStore(self.load_json_file(self.out_dir+'/history.json', []), self.character_list, PIPELINE_STAGES)
+            self.ship_lookup = self.load_json_file(self.out_dir+'/ship_lookup.json', {})
+            self.solarsystem_lookup = self.load_json_file(self.out_dir+'/solarsystem_lookup.json', {})
+            self.character_lookup = self.load_json_file(self.out_dir+'/character_lookup.json', {})
+            self.corp_lookup = self.load_json_file(self.out_dir+'/corp_lookup.json', {})
+            self.alliance_lookup = self.load_json_file(self.out_dir+'/alliance_lookup.json', {})
+            #load per-character high-water marks (highest killmail_id seen on zkill)
+            self.most_recent_killID = self.load_json_file(self.out_dir+'/zkill_progress.json', {})
 
-        with open('data/target_banned_types.json', 'r') as fd:
-            self.target_banned_types = json.load(fd)
+        if self.snapshot == None:
+            for lookup in LOOKUP_TABLES:
+                intern_names(getattr(self, lookup))
+                self.saved_lookup_sizes[lookup] = len(getattr(self, lookup))
+        self.saved_progress = dict(self.most_recent_killID)
+        self.snapshot_current = self.snapshot != None # started from it, so it matches what is saved
 
-        #load current history
-        try:
-            with open('out/data/history.json', 'r') as fd:
-                self.history = json.load(fd)
-        except FileNotFoundError:
-            with open('out/data/history.json', 'a+') as faild:
-                self.history = []
-                json.dump(self.history, faild)
+        #the boards of a multi-board build resolve names into one set of tables
+        if self.shared.multi_board:
+            self.shared.add_board(self.our_ids, {lookup: getattr(self, lookup) for lookup in LOOKUP_TABLES})
+            for lookup in LOOKUP_TABLES:
+                setattr(self, lookup, self.shared.lookups[lookup])
 
-        #load ship_lookup (ID dictionary) json
-        try:
-            with open('out/data/ship_lookup.json', 'r') as fd:
-                self.ship_lookup = json.load(fd)
-        except FileNotFoundError:
-            with open('out/data/ship_lookup.json', 'a+') as faild:
-                json.dump({}, faild)
-            self.ship_lookup = {}
+        #offline type and system names, built by sde.py. without it those come from esi
+        self.static_data = StaticData.open(self.data_dir+'/sde.sqlite')
 
-        #load solarsystem_lookup (ID dictionary) json
-        try:
-            with open('out/data/solarsystem_lookup.json', 'r') as fd:
-                self.solarsystem_lookup = json.load(fd)
-        except FileNotFoundError:
-            with open('out/data/solarsystem_lookup.json', 'a+') as faild:
-                json.dump({}, faild)
-            self.solarsystem_lookup = {}
+        #rendered day blocks from the previous build, local only like the snapshot. older
+        #builds kept them in fragment_cache.json, which went out with the published data
+        self.fragments = FragmentCache(self.out_dir+'/fragments.cache', os.path.join(app.root_path, 'templates', 'day.html'))
+        if os.path.exists(self.out_dir+'/fragment_cache.json'):
+            os.remove(self.out_dir+'/fragment_cache.json')
 
-        #load character_lookup (ID dictionary) json
+    def __getattr__(self, name):
+        #lookup tables restored from a snapshot, unpickled the first time they are used
+        snapshot = self.__dict__.get('snapshot')
+        if name not in LOOKUP_TABLES or snapshot == None:
+            raise AttributeError(name)
         try:
-            with open('out/data/character_lookup.json', 'r') as fd:
-                self.character_lookup = json.load(fd)
-        except FileNotFoundError:
-            with open('out/data/character_lookup.json', 'a+') as faild:
-                json.dump({}, faild)
-            self.character_lookup = {}
+            table = snapshot.load(name)
+        except SNAPSHOT_ERRORS as error:
+            log.warning('snapshot %s unreadable (%s), loading it again', name, error)
+            if self.sqlite:
+                table = self.sqlite.load_lookup(name)
+            else:
+                table = self.load_json_file(self.out_dir+'/'+name+'.json', {})
+        intern_names(table)
+        setattr(self, name, table)
+        self.saved_lookup_sizes[name] = len(table)
+        if all(x in self.__dict__ for x in LOOKUP_TABLES):
+            self.snapshot = None # every section is out, let the file's bytes go
+        return table
 
-        #load corp_lookup (ID dictionary) json
+    def saved_files(self):
+        #what write_data_to_file leaves in out_dir, a snapshot is only good while these are unchanged
+        return [self.out_dir+'/'+x+'.json' for x in ('history', 'zkill_progress') + LOOKUP_TABLES]
+
+    def snapshot_sources(self):
+        #with sqlite the database's write generation stands in for history and the lookup files
+        if self.sqlite:
+            return dict(fingerprint([self.out_dir+'/zkill_progress.json']), sqlite_generation=self.sqlite.generation())
+        return fingerprint(self.saved_files())
+
+    def load_snapshot(self):
+        snapshot = Snapshot.read(self.snapshot_path, self.snapshot_sources())
+        if snapshot == None:
+            return None
         try:
-            with open('out/data/corp_lookup.json', 'r') as fd:
-                self.corp_lookup = json.load(fd)
-        except FileNotFoundError:
-            with open('out/data/corp_lookup.json', 'a+') as faild:
-                json.dump({}, faild)
-            self.corp_lookup = {}
+            history = snapshot.load('history')
+        except SNAPSHOT_ERRORS as error:
+            log.warning('snapshot unreadable (%s), loading the saved state', error)
+            return None
+        if history.current_stamp != dict(PIPELINE_STAGES) or history.character_list != self.character_list:
+            log.info('snapshot predates a change to the stages or characters, loading the saved state')
+            return None
+        return snapshot
 
-        #load alliance_lookup (ID dictionary) json
+    def load_json_file(self, path, default):
+        #missing files start out empty and are created on the first write_data_to_file
         try:
-            with open('out/data/alliance_lookup.json', 'r') as fd:
-                self.alliance_lookup = json.load(fd)
+            with open(path, 'r') as fd:
+                return json.load(fd)
         except FileNotFoundError:
-            with open('out/data/alliance_lookup.json', 'a+') as faild:
-                json.dump({}, faild)
-            self.alliance_lookup = {}
+            return default
+
+    def endpoint_family(self, url):
+        #metrics label for the api a url belongs to
+        if url.startswith(self.esi_api+'killmails/'):
+            return 'esi_killmails'
+        if url.startswith(self.esi_api+'universe/names/'):
+            return 'esi_names'
+        if url.startswith(self.esi_api):
+            return 'esi_lookup'
+        return 'zkill'
 
-    def api_call_wrap(self, url):
+    def api_call_wrap(self, url, stream=False):
         api_response = None
         if type(url) != str:
             raise ValueError('zKill:api_call_wrap was passed a url that was not a string')
-        if self.do_file_cache:
-            if self.last_call_cache_hit is False:
-                time.sleep(1) # 'be polite' with requests (cached_sess)
-            api_response = self.cached_sess.get(url)
-            self.last_call_cache_hit = api_response.from_cache
-        else:
-            time.sleep(1)  # 'be polite' with requests
-            api_response = requests.get(url)
-            if api_response.ok == False:
-                time.sleep(5) # assume timeout with one more try after a small wait
-                api_response = requests.get(url)
-                if api_response.ok == False:
-                    #assume we have been locked out
-                    raise ValueError(f'zKill:api_call_wrap api request was given garbage twice: \nurl: {url}\nresponse: {api_response.text}')
+        bucket = self.esi_bucket if url.startswith(self.esi_api) else self.zkill_bucket
+        api_response = self.http.get(url, self.endpoint_family(url), bucket, stream=stream)
+        if api_response.ok == False:
+            #transient failures were already retried with backoff, assume we have been locked out
+            raise ValueError(f'zKill:api_call_wrap api request failed after retries: \nurl: {url}\nresponse: {api_response.text}')
         return api_response
 
+    def api_post_wrap(self, url, payload):
+        #esi POST endpoints are never cached, the caller handles a failed batch itself
+        if type(url) != str:
+            raise ValueError('zKill:api_post_wrap was passed a url that was not a string')
+        return self.http.post(url, self.endpoint_family(url), self.esi_bucket, payload)
+
     def update_kill_history(self):
-        api_call_frontstr = "http://zkillboard.com/api/characterID/"
+        api_call_frontstr = self.zkill_api+"characterID/"
         api_call_backstr = "/no-items/page/"
         raw_api_by_char = {}
         for name in self.character_list:
             api_call_minus_page_num = api_call_frontstr + str(self.character_list[name]) + api_call_backstr
+            #characters without a high-water mark have never been crawled, so walk all their pages
+            incremental = not self.full_crawl and self.most_recent_killID.get(name) != None
             current_page = 1
-            print('calling zkill: '+api_call_minus_page_num+str(current_page)+'/')
-            raw_api_data = self.api_call_wrap(api_call_minus_page_num+str(current_page)+'/').json()
+            raw_api_data = self.zkill_page(api_call_minus_page_num+str(current_page)+'/')
             raw_api_by_char[name] = raw_api_data
             while len(raw_api_data) != 0: #ensure there are no further pages
+                if incremental and self.page_already_stored(raw_api_data):
+                    break #zkill pages are newest first, everything past here is already in history
                 current_page += 1
-                print('calling zkill: ' +api_call_minus_page_num+str(current_page)+'/')
-                raw_api_data = self.api_call_wrap(api_call_minus_page_num+str(current_page)+'/').json()
+                raw_api_data = self.zkill_page(api_call_minus_page_num+str(current_page)+'/')
                 raw_api_by_char[name] += raw_api_data
         #no more pages on the api with data
         for name in self.character_list: #for each character
             for kill in raw_api_by_char[name]: #for each kill
                 if kill == []: #if we are at the end of the list ignore the last empty item
                     continue
-                save_check = True
-                for hist_kill in self.history: #if it exists already, don't append
-                    if hist_kill['killmail_id'] == kill['killmail_id']:
-                        save_check = False
-                        break
-                if save_check: #if it doesn't exist then append it
-                    self.history.append(kill)
+                if kill['killmail_id'] > self.most_recent_killID.get(name, 0):
+                    self.most_recent_killID[name] = kill['killmail_id']
+                self.history.add(kill) #no-op if it exists already (several of our characters on one kill)
+            #a character with no kills at all still counts as crawled
+            self.most_recent_killID.setdefault(name, 0)
 
-    def update_kill_details(self):
-        api_call_frontstr = "https://esi.evetech.net/latest/killmails/"
-        api_call_backstr = "/?datasource=tranquility&language=en-us"
-        for kill in self.history:
+    def zkill_page(self, url):
+        #boards sharing a character walk the same pages, only the first one asks zkill
+        if not self.shared.multi_board:
+            log.debug('calling zkill: %s', url)
+            return self.api_call_wrap(url).json()
+        page = self.shared.zkill_pages.get(url)
+        if page != None:
+            self.metrics.inc('shared_fetch_total', kind='zkill_page')
+        else:
+            log.debug('calling zkill: %s', url)
+            page = self.shared.zkill_pages[url] = self.api_call_wrap(url).json()
+        return copy.deepcopy(page) # its entries become this board's history mails
+
+    def page_already_stored(self, page):
+        #true when every killmail on a zkill page is one we already have
+        return all(kill['killmail_id'] in self.history for kill in page if kill != [])
+
+    def update_kill_details(self, mails):
+        pending = []
+        for kill in mails:
             if kill.get('attackers') != None:
                 continue
             if kill.get('ccp_esi', False):
                 continue #no need to call ccp for this killmail
-            api_call_id = str(kill['killmail_id'])
-            api_call_hash = str(kill['zkb']['hash'])
-            api_call = api_call_frontstr + api_call_id + '/' + api_call_hash + api_call_backstr
-            print('calling ccp esi: '+api_call)
-            raw_api_data = self.api_call_wrap(api_call).json()
-            # grab all key
-            for key in raw_api_data.keys():
-                kill[key] = raw_api_data[key]
-            kill['ccp_esi'] = True
-        #set victim name
-
-    def prune_unused_history_fields(self):
-        for mail in self.history:
-            mail.pop('moonID', None) #prune moon info
-            mail.pop('position', None) #we don't need y,x,z in-space coords
-            #mail['zkb'].pop('hash', None) #prune zkill hash value
-            mail['zkb'].pop('points', None) #prune points metric because it means literally nothing
-            mail['zkb'].pop('awox', None) #prune
-            mail['victim'].pop('damage_taken', None) #prune
-            mail['victim'].pop('items', None) #prune
-            mail['victim'].pop('position', None) #prune
-            if mail.get('involved', None) == None:
-                mail['involved'] = len(mail['attackers']) # save number involved because we are pruning attackers
-            pruned_attackers = []
-            for attacker in mail['attackers']: #keep only those on character_list or final_blow == True
-                if attacker.get('final_blow', None) or attacker.get('character_id', None) in self.character_list.values():
-                    attacker.pop('securityStatus', None) # drop zkill sec status
-                    attacker.pop('security_status', None) # drop esi sec status
-                    attacker.pop('damage_done', None) # drop raw damage (not ehp)
-                    attacker.pop('ship_type_id', None) # drop ship_type (it's mostly wrong on most mails)
-                    attacker.pop('weapon_type_id', None) # drop weapon_type (it's mostly wrong on most mails)
-                    pruned_attackers.append(attacker)
-                    #save final_blow to top level location also
-                    if attacker.get('final_blow', False):
-                        mail['final_blow'] = attacker
-            mail['attackers'] = pruned_attackers
-
-    def tag_involved_characters(self):
-        for mail in self.history:
-            #if our_chracters tag exists, skip this mail
-            if mail.get('our_characters', None) != None:
-                continue
-            #build an array of all of our characters involved
-            involved = []
+            pending.append(kill)
+        #fetch concurrently, the shared buckets keep the pool polite.
+        #map() yields results in submission order so the merge below is deterministic
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(self.fetch_kill_details, pending)
+            for kill, raw_api_data in zip(pending, results):
+                # grab all key (already pruned while it was parsed)
+                for key in raw_api_data.keys():
+                    kill[key] = raw_api_data[key]
+                kill['ccp_esi'] = True
+                self.history.reindex(kill) #killmail_time is only known after the esi call
+
+    def fetch_kill_details(self, kill):
+        #in a multi-board build every killmail is fetched once, parsed keeping the attackers
+        #of all boards; stage_prune then narrows each board's copy to its own characters
+        if not self.shared.multi_board:
+            return self.fetch_esi_killmail(kill, self.our_ids)
+        cached = self.shared.killmails.get(kill['killmail_id'])
+        if cached != None:
+            self.metrics.inc('shared_fetch_total', kind='killmail')
+        else:
+            cached = self.shared.killmails[kill['killmail_id']] = self.fetch_esi_killmail(kill, self.shared.our_ids)
+        return copy.deepcopy(cached) # the stages edit it in place
+
+    def fetch_esi_killmail(self, kill, our_ids):
+        api_call_frontstr = self.esi_api+"killmails/"
+        api_call_backstr = "/?datasource=tranquility&language=en-us"
+        api_call_id = str(kill['killmail_id'])
+        api_call_hash = str(kill['zkb']['hash'])
+        api_call = api_call_frontstr + api_call_id + '/' + api_call_hash + api_call_backstr
+        return self.stream_esi_killmail(api_call, our_ids)
+
+    def stream_esi_killmail(self, api_call, our_ids):
+        #an esi killmail pruned while it streams in, see ingest.parse_killmail
+        log.debug('calling ccp esi: %s', api_call)
+        api_response = self.api_call_wrap(api_call, stream=True)
+        api_response.raw.decode_content = True # let urllib3 undo gzip before the parser sees it
+        try:
+            return parse_killmail(api_response.raw, our_ids)
+        finally:
+            if not getattr(api_response, 'from_cache', False):
+                self.metrics.inc('http_response_bytes_total', api_response.raw.tell(), family='esi_killmails')
+            api_response.close()
+
+    def stage_prune(self, mail):
+        mail.pop('moonID', None) #prune moon info
+        mail.pop('position', None) #we don't need y,x,z in-space coords
+        #mail['zkb'].pop('hash', None) #prune zkill hash value
+        mail['zkb'].pop('points', None) #prune points metric because it means literally nothing
+        mail['zkb'].pop('awox', None) #prune
+        mail['victim'].pop('damage_taken', None) #prune
+        mail['victim'].pop('items', None) #prune
+        mail['victim'].pop('position', None) #prune
+        if mail.get('involved', None) == None:
+            mail['involved'] = len(mail['attackers']) # save number involved because we are pruning attackers
+        pruned_attackers = []
+        for attacker in mail['attackers']: #keep only those on character_list or final_blow == True
+            if attacker.get('final_blow', None) or attacker.get('character_id', None) in self.our_ids:
+                attacker.pop('securityStatus', None) # drop zkill sec status
+                attacker.pop('security_status', None) # drop esi sec status
+                attacker.pop('damage_done', None) # drop raw damage (not ehp)
+                attacker.pop('ship_type_id', None) # drop ship_type (it's mostly wrong on most mails)
+                attacker.pop('weapon_type_id', None) # drop weapon_type (it's mostly wrong on most mails)
+                pruned_attackers.append(attacker)
+                #save final_blow to top level location also
+                if attacker.get('final_blow', False):
+                    mail['final_blow'] = attacker
+        mail['attackers'] = pruned_attackers
+
+    def collect_unresolved_ids(self, mails):
+        #every id the tagging stages would have to look up, grouped by the lookup table it lands in
+        unresolved = {'character': set(), 'corporation': set(), 'alliance': set(),
+                      'inventory_type': set(), 'solar_system': set()}
+        for mail in mails:
             for attacker in mail['attackers']:
-                if attacker.get('character_id', None) in self.character_list.values():
-                    temp_name = self.reverse_character_list[str(attacker['character_id'])]
-                    involved.append(temp_name)
-                    attacker['character_name'] = temp_name
-                if attacker.get('character_id', None) != None and attacker.get('character_name', None) == None:
-                    attacker['character_name'] = self.lookup_character_name(attacker['character_id'])
-            mail['our_characters'] = involved
-            mail['our_involved_html'] = ('<BR>'.join(x for x in involved))
-            # tag alliance name, corp name, character_name
-            if mail['victim'].get('alliance_id', None) != None:
-                mail['victim']['alliance_name'] = self.lookup_alliance_name(mail['victim']['alliance_id'])
-            if mail['victim'].get('corporation_id', None) != None:
-                mail['victim']['corporation_name'] = self.lookup_corp_name(mail['victim']['corporation_id'])
-            if mail['victim'].get('character_id', None) != None:
-                mail['victim']['character_name'] = self.lookup_character_name(mail['victim']['character_id'])
-            if mail['final_blow'].get('character_id', None) != None:
-                mail['final_blow']['character_name'] = self.lookup_character_name(mail['final_blow']['character_id'])
-            if mail['final_blow'].get('alliance_id', None) != None:
-                mail['final_blow']['alliance_name'] = self.lookup_alliance_name(mail['final_blow']['alliance_id'])
-            if mail['zkb'].get('npc', False): # NPC do not have character names
-                if mail['final_blow'].get('character_id', None) == None:
-                    mail['final_blow']['character_name'] = self.lookup_shipTypeID(mail['final_blow']['ship_type_id'])
-
-    def tag_as_kill_loss_or_friendly_fire(self):
-        for mail in self.history:
-            #if row_type tag exists, skip this mail
-            if mail.get('row_type', None) != None:
-                continue
-            #if one of our characters is the victim it is a loss
-            if mail.get('victim', None) != None:
-                if mail['victim'].get('character_id', None) in self.character_list.values():
-                    #if one of our characters is on the killmail it's not just a loss
-                    #it's a friendly fire incident
-                    for attacker in mail['attackers']:
-                        if attacker.get('character_id', None) in self.character_list.values():
-                            mail['row_type'] = 'row-friendly_fire'
-                            break
-                    if mail.get('row_type', None) == None: # if it wasn't tagged friendly fire
-                        mail['row_type'] = 'row-loss'      # then it's just a loss
-                else: # if one of our characters isn't the victim then it is a kill
-                    mail['row_type'] = 'row-kill'
+                if attacker.get('character_id', None) not in self.our_ids:
+                    unresolved['character'].add(attacker.get('character_id', None))
+            unresolved['alliance'].add(mail['victim'].get('alliance_id', None))
+            unresolved['corporation'].add(mail['victim'].get('corporation_id', None))
+            unresolved['character'].add(mail['victim'].get('character_id', None))
+            unresolved['character'].add(mail['final_blow'].get('character_id', None))
+            unresolved['alliance'].add(mail['final_blow'].get('alliance_id', None))
+            if mail['zkb'].get('npc', False) and mail['final_blow'].get('character_id', None) == None:
+                unresolved['inventory_type'].add(mail['final_blow'].get('ship_type_id', None))
+            unresolved['solar_system'].add(mail.get('solar_system_id', None))
+            unresolved['inventory_type'].add(mail['victim'].get('ship_type_id', None))
+        lookups = self.name_lookups()
+        for category in unresolved:
+            unresolved[category] = set(x for x in unresolved[category] if x != None and str(x) not in lookups[category]
+                                       and self.static_name(category, x) == None)
+        return unresolved
+
+    def name_lookups(self):
+        #ESI /universe/names/ category -> the lookup table that caches it
+        return {'character':      self.character_lookup,
+                'corporation':    self.corp_lookup,
+                'alliance':       self.alliance_lookup,
+                'inventory_type': self.ship_lookup,
+                'solar_system':   self.solarsystem_lookup}
+
+    def resolve_names(self, mails):
+        #resolve every unknown id on the pending killmails up front in bulk, so the
+        #tagging stages find them in the lookup tables instead of calling ESI per id
+        unresolved = self.collect_unresolved_ids(mails)
+        ids = sorted(set().union(*unresolved.values()))
+        for start in range(0, len(ids), 1000): # esi accepts at most 1000 ids per call
+            self.resolve_name_batch(ids[start:start+1000])
+
+    def resolve_name_batch(self, ids):
+        api_call = self.esi_api+'universe/names/?datasource=tranquility'
+        log.debug('calling CCP: %s (%d ids)', api_call, len(ids))
+        api_response = self.api_post_wrap(api_call, ids)
+        if api_response.status_code == 404:
+            #one bad id fails the whole batch, so split until it is isolated.
+            #a single bad id is left to the per-id lookup in the tagging stages
+            if len(ids) > 1:
+                self.resolve_name_batch(ids[:len(ids)//2])
+                self.resolve_name_batch(ids[len(ids)//2:])
+            return
+        if api_response.ok == False:
+            return #fall back to per-id lookups
+        lookups = self.name_lookups()
+        for entry in api_response.json():
+            if entry.get('category') in lookups:
+                lookups[entry['category']][str(entry['id'])] = entry['name']
+                self.metrics.inc('names_resolved_total', category=entry['category'])
+
+    def static_name(self, category, theID):
+        #types and systems from the sde index, copied into their lookup table so later
+        #builds find them there. None for other categories or ids newer than the dump
+        if self.static_data == None:
+            return None
+        if category == 'inventory_type':
+            theName = self.static_data.type_name(theID)
+        elif category == 'solar_system':
+            theName = self.static_data.system_name(theID)
+        else:
+            return None
+        if theName != None:
+            self.name_lookups()[category][str(theID)] = sys.intern(theName)
+            self.metrics.inc('static_data_total', category=category)
+        return theName
+
+    def count_lookup(self, table, name):
+        #a miss is about to become a per-id esi call
+        self.metrics.inc('lookup_total', table=table, result='hit' if name != None else 'miss')
+
+    def stage_involved(self, mail):
+        #build an array of all of our characters involved
+        involved = []
+        for attacker in mail['attackers']:
+            if attacker.get('character_id', None) in self.our_ids:
+                temp_name = self.reverse_character_list[str(attacker['character_id'])]
+                involved.append(temp_name)
+                attacker['character_name'] = temp_name
+            if attacker.get('character_id', None) != None and attacker.get('character_name', None) == None:
+                attacker['character_name'] = self.lookup_character_name(attacker['character_id'])
+        mail['our_characters'] = involved
+        mail['our_involved_html'] = ('<BR>'.join(x for x in involved))
+        # tag alliance name, corp name, character_name
+        if mail['victim'].get('alliance_id', None) != None:
+            mail['victim']['alliance_name'] = self.lookup_alliance_name(mail['victim']['alliance_id'])
+        if mail['victim'].get('corporation_id', None) != None:
+            mail['victim']['corporation_name'] = self.lookup_corp_name(mail['victim']['corporation_id'])
+        if mail['victim'].get('character_id', None) != None:
+            mail['victim']['character_name'] = self.lookup_character_name(mail['victim']['character_id'])
+        if mail['final_blow'].get('character_id', None) != None:
+            mail['final_blow']['character_name'] = self.lookup_character_name(mail['final_blow']['character_id'])
+        if mail['final_blow'].get('alliance_id', None) != None:
+            mail['final_blow']['alliance_name'] = self.lookup_alliance_name(mail['final_blow']['alliance_id'])
+        if mail['zkb'].get('npc', False): # NPC do not have character names
+            if mail['final_blow'].get('character_id', None) == None:
+                mail['final_blow']['character_name'] = self.lookup_shipTypeID(mail['final_blow']['ship_type_id'])
+
+    def stage_row_type(self, mail):
+        mail.pop('row_type', None)
+        #if one of our characters is the victim it is a loss
+        if mail.get('victim', None) != None:
+            if mail['victim'].get('character_id', None) in self.our_ids:
+                #if one of our characters is on the killmail it's not just a loss
+                #it's a friendly fire incident
+                for attacker in mail['attackers']:
+                    if attacker.get('character_id', None) in self.our_ids:
+                        mail['row_type'] = 'row-friendly_fire'
+                        break
+                if mail.get('row_type', None) == None: # if it wasn't tagged friendly fire
+                    mail['row_type'] = 'row-loss'      # then it's just a loss
+            else: # if one of our characters isn't the victim then it is a kill
+                mail['row_type'] = 'row-kill'
 
     def lookup_alliance_name(self, theID):
         #if id present in self.alliance_lookup don't call the api
         temp_alliance_name = self.alliance_lookup.get(str(theID), None)
+        self.count_lookup('alliance_lookup', temp_alliance_name)
         if temp_alliance_name != None:
             return temp_alliance_name
         else: #better call ccp example: https://esi.evetech.net/latest/alliances/300578921/?datasource=tranquility&language=en-us
-            api_call_front_str = 'https://esi.evetech.net/latest/alliances/'
+            api_call_front_str = self.esi_api+'alliances/'
             api_call = api_call_front_str + str(theID) + '/?datasource=tranquility&language=en-us'
-            print('calling CCP: '+str(api_call))
+            log.debug('calling CCP: %s', api_call)
             api_result = self.api_call_wrap(str(api_call)).json()
             theName = api_result['name']
             #and save result
@@ -263,12 +506,13 @@ class zKillAPI():
     def lookup_corp_name(self, theID):
         #if id present in self.corp_lookup don't call the api
         temp_corp_name = self.corp_lookup.get(str(theID), None)
+        self.count_lookup('corp_lookup', temp_corp_name)
         if temp_corp_name != None:
             return temp_corp_name
         else: #better call ccp example: https://esi.evetech.net/latest/corporations/300578921/?datasource=tranquility&language=en-us
-            api_call_front_str = 'https://esi.evetech.net/latest/corporations/'
+            api_call_front_str = self.esi_api+'corporations/'
             api_call = api_call_front_str + str(theID) + '/?datasource=tranquility&language=en-us'
-            print('calling CCP: '+str(api_call))
+            log.debug('calling CCP: %s', api_call)
             api_result = self.api_call_wrap(str(api_call)).json()
             theName = api_result['name']
             #and save result
@@ -278,12 +522,13 @@ class zKillAPI():
     def lookup_character_name(self, theID):
         #if id present in self.character_lookup don't call the api
         temp_character_name = self.character_lookup.get(str(theID), None)
+        self.count_lookup('character_lookup', temp_character_name)
         if temp_character_name != None:
             return temp_character_name
         else: #better call ccp example: https://esi.evetech.net/latest/characters/300578921/?datasource=tranquility&language=en-us
-            api_call_front_str = 'https://esi.evetech.net/latest/characters/'
+            api_call_front_str = self.esi_api+'characters/'
             api_call = api_call_front_str + str(theID) + '/?datasource=tranquility&language=en-us'
-            print('calling CCP: '+str(api_call))
+            log.debug('calling CCP: %s', api_call)
             api_result = self.api_call_wrap(str(api_call)).json()
             theName = api_result['name']
             #and save result
@@ -291,7 +536,7 @@ class zKillAPI():
             return theName
 
     def kill_counts(self, killtype):
-        return len([x for x in self.history if x['row_type'] == killtype])
+        return self.aggregate().count(killtype)
 
     def engineering_number_string(self, value):
         powers = [10 ** x for x in (3, 6, 9, 12, 15, 18, 21, 24, 27, 30, 33, 100)]
@@ -316,240 +561,627 @@ class zKillAPI():
                 return (''.join([format, human_powers[ordinal - 1]])) % chopped
         return str(value)
 
-    def tag_formatted_values(self):
-        for mail in self.history:
-            #if count of minutes into day exists, skip. Used for sorting kills within a day
-            if mail.get('minutes_into_day') == None:
-                mail['minutes_into_day'] = int(mail['killmail_time'][11:13])*60+int(mail['killmail_time'][14:16])
-            #if formatted_price tag exists, skip. Used for final web page output
-            if mail.get('formatted_price') == None:
-                mail['formatted_price'] = self.engineering_number_string(mail['zkb']['totalValue'])
+    def stage_formatted(self, mail):
+        #count of minutes into day, used for sorting kills within a day
+        mail['minutes_into_day'] = int(mail['killmail_time'][11:13])*60+int(mail['killmail_time'][14:16])
+        #formatted_price, used for final web page output
+        mail['formatted_price'] = self.engineering_number_string(mail['zkb']['totalValue'])
 
     def kill_sums(self, killtype):
-        r = sum(self.verify_kill(x, killtype) for x in self.history)
-        return self.engineering_number_string(r)
-
-    def verify_kill(self, k, killtype):
-        if k['row_type'] in [killtype, 'row-friendly_fire']:
-            if 'zkb' in k and 'totalValue' in k['zkb']:
-                return k['zkb']['totalValue']
-        return 0
+        return self.engineering_number_string(self.aggregate().isk(killtype))
 
     def format_date(self, dateval):
         year = str(int(dateval[0:4]))
         month = int(dateval[5:7])
         day = str(int(dateval[8:10]))
-        monthname = ['','January', 'February', 'March', 'April', 'May', \
-            'June', 'July', 'August', 'September', 'October', 'November', \
-            'December']
-        return monthname[month] + ' ' + day + ', ' + year
-
-    def kills_by_date(self):
-        kills = defaultdict(list)
-        for kill in self.history:
-            kills[kill['killmail_time'][0:10]].append(kill)
-        kills_by_day = sorted(kills.items(), key=lambda x: x[0], reverse=True)
-        result = []
-        for day, killmails in kills_by_day:
-            reversed_killmails = sorted(killmails, key=lambda x: x['minutes_into_day'], reverse=True)
-            result.append((day, self.format_date(day), reversed_killmails))
-        return result
+        return MONTH_NAMES[month] + ' ' + day + ', ' + year
 
-    def pod_kills_by_date(self):
-        kills = defaultdict(list)
-        for kill in self.history:
-            if kill['row_type'] != 'row-kill':
-                continue
-            if kill['victim'].get('alliance_id',0) not in self.pod_alliances:
-                continue
-            if kill['victim'].get('ship_type_id',0) != 670:
-                continue
-            if kill.get('final_blow',{}).get('character_name','') not in self.character_list.keys():
-                continue
-            kills[kill['killmail_time'][0:10]].append(kill)
-        kills_by_day = sorted(kills.items(), key=lambda x: x[0], reverse=True)
-        result = []
-        for day, killmails in kills_by_day:
-            reversed_killmails = sorted(killmails, key=lambda x: x['minutes_into_day'], reverse=True)
-            result.append((day, self.format_date(day), reversed_killmails))
-        return result
+    def format_month(self, monthval):
+        return MONTH_NAMES[int(monthval[5:7])] + ' ' + str(int(monthval[0:4]))
 
-    def target_kills_by_date(self):
-        kills = defaultdict(list)
-        for kill in self.history:
-            if kill['row_type'] != 'row-kill':
-                continue
-            if kill['victim'].get('alliance_id',0) not in self.target_alliances:
-                continue
-            if kill['victim'].get('ship_type_id',0) in self.target_banned_types:
-                continue
-            #uncomment if being used for final blow only tracking
-            #if kill.get('final_blow',{}).get('character_name','') not in self.character_list.keys():
-            #    continue
-            kills[kill['killmail_time'][0:10]].append(kill)
-        kills_by_day = sorted(kills.items(), key=lambda x: x[0], reverse=True)
-        result = []
-        for day, killmails in kills_by_day:
-            reversed_killmails = sorted(killmails, key=lambda x: x['minutes_into_day'], reverse=True)
-            result.append((day, self.format_date(day), reversed_killmails))
-        return result
+    def aggregate(self):
+        #one scan of history for every view, reused until history changes
+        if self.aggregate_cache == None or not self.aggregate_cache.is_current(self.history):
+            views = {view['name']: view['predicate'] for view in self.views if view['enabled']}
+            self.aggregate_cache = BoardAggregate(self.history, views, self.format_date)
+        return self.aggregate_cache
 
-    def tag_solarSystemName(self):
-        for mail in self.history:
-            theID = mail['solar_system_id']
-            if mail.get('solar_system_name', None) != None:
-                continue
-            #if solarSystemID present in self.solarsystem_lookup don't call the api
-            temp_solarsystem_name = self.solarsystem_lookup.get(str(theID), None)
-            if temp_solarsystem_name != None:
-                mail['solar_system_name'] = temp_solarsystem_name
-            else: #better call CCP example: https://esi.evetech.net/latest/universe/systems/30002022/?datasource=tranquility&language=en-us
-                api_call_front_str = 'https://esi.evetech.net/latest/universe/systems/'
-                api_call = api_call_front_str+str(theID)+'/?datasource=tranquility&language=en-us'
-                print('calling CCP: '+str(api_call))
-                api_result = self.api_call_wrap(str(api_call)).json()
-                theName = api_result['name']
-                mail['solar_system_name'] = theName
-                #and save this result so we don't call CCP again
-                self.solarsystem_lookup[str(theID)] = theName
-
-    def tag_shipTypeID(self):
-        for mail in self.history:
-            theID = mail['victim']['ship_type_id']
-            if mail['victim'].get('ship_type_name', None) != None:
-                continue
-            mail['victim']['ship_type_name'] = self.lookup_shipTypeID(theID)
+    def character_aggregate(self, charname):
+        #same scan as aggregate() but only over the character index entry, so
+        #building every character page costs one pass over total kills
+        cached = self.character_aggregates.get(charname)
+        if cached == None or not cached.is_current(self.history):
+            cached = BoardAggregate(self.history, {'all': lambda kill: True}, self.format_date,
+                                    self.history.for_character(charname))
+            self.character_aggregates[charname] = cached
+        return cached
+
+    def analytics(self):
+        #numpy columns for the stats page, rebuilt only when history changes
+        if self.analytics_cache == None or not self.analytics_cache.is_current(self.history):
+            self.analytics_cache = BoardAnalytics(self.history, self.our_ids)
+        return self.analytics_cache
+
+    def data_api(self):
+        #month shards and manifest for the client rendered board, rebuilt only when history changes
+        if self.data_api_cache == None or not self.data_api_cache.is_current(self.history):
+            views = {view['name']: view['predicate'] for view in self.views if view['enabled']}
+            self.data_api_cache = DataAPI(self.history, views, self.manifest_data(), self.format_month)
+        return self.data_api_cache
+
+    def manifest_data(self):
+        characters = []
+        for name, charid in sorted(self.character_list.items()):
+            board = self.character_data(charid)
+            characters.append({'name': name, 'id': charid, 'totals': {key: board[key] for key in TOTAL_KEYS}})
+        board = self.data
+        return {'board_name':      self.board_name,
+                'totals':          {key: board[key] for key in TOTAL_KEYS},
+                'views':           [{'name': x['name'], 'title': x['title'], 'board_suffix': x['board_suffix']} for x in self.views if x['enabled']],
+                'characters':      characters,
+                'front_page_days': self.front_page_days}
+
+    def kills_by_date(self, view_name='all'):
+        return self.aggregate().kills_by_date(view_name)
+
+    def view_for_route(self, route):
+        for view in self.views:
+            if view['enabled'] and view['route'] == route:
+                return view
+        return None
+
+    def stage_solar_system(self, mail):
+        theID = mail['solar_system_id']
+        #if solarSystemID present in self.solarsystem_lookup don't call the api
+        temp_solarsystem_name = self.solarsystem_lookup.get(str(theID), None)
+        if temp_solarsystem_name == None:
+            temp_solarsystem_name = self.static_name('solar_system', theID)
+        self.count_lookup('solarsystem_lookup', temp_solarsystem_name)
+        if temp_solarsystem_name != None:
+            mail['solar_system_name'] = temp_solarsystem_name
+        else: #better call CCP example: https://esi.evetech.net/latest/universe/systems/30002022/?datasource=tranquility&language=en-us
+            api_call_front_str = self.esi_api+'universe/systems/'
+            api_call = api_call_front_str+str(theID)+'/?datasource=tranquility&language=en-us'
+            log.debug('calling CCP: %s', api_call)
+            api_result = self.api_call_wrap(str(api_call)).json()
+            theName = api_result['name']
+            mail['solar_system_name'] = theName
+            #and save this result so we don't call CCP again
+            self.solarsystem_lookup[str(theID)] = theName
+
+    def stage_ship_type(self, mail):
+        mail['victim']['ship_type_name'] = self.lookup_shipTypeID(mail['victim']['ship_type_id'])
 
     def lookup_shipTypeID(self, theID):
         temp_ship_name = self.ship_lookup.get(str(theID), None)
+        if temp_ship_name == None:
+            temp_ship_name = self.static_name('inventory_type', theID)
+        self.count_lookup('ship_lookup', temp_ship_name)
         if temp_ship_name != None:
             return temp_ship_name
         else: #better call CCP example: https://esi.evetech.net/latest/universe/types/603/?datasource=tranquility&language=en-us
-            api_call_front_str = 'https://esi.evetech.net/latest/universe/types/'
+            api_call_front_str = self.esi_api+'universe/types/'
             api_call = api_call_front_str + str(theID) + '/?datasource=tranquility&language=en-us'
-            print('calling CCP: '+ api_call)
+            log.debug('calling CCP: %s', api_call)
             api_result = self.api_call_wrap(str(api_call)).json()
             theName = api_result['name']
             #and save this result so we don't call CCP again
             self.ship_lookup[str(theID)] = theName
             return theName
 
-    def use_character(self, charid):
-        cs = {v:k for k,v in self.character_list.items()}
-        charname = cs[charid]
-        self.history = [x for x in self.history if charname in x['our_characters'] or charname == x['victim']['character_name']]
-        self.board_name = charname
+    def unsaved_changes(self):
+        #lookup tables only ever grow, and one still waiting in the snapshot was never touched
+        if self.history.dirty or not self.snapshot_current or self.most_recent_killID != self.saved_progress:
+            return True
+        return any(len(self.__dict__[x]) != self.saved_lookup_sizes.get(x) for x in LOOKUP_TABLES if x in self.__dict__)
 
     def write_data_to_file(self):
-        print('writing data')
-        with open('out/data/history.json', 'w') as outfile:
-            json.dump(self.history, outfile)
-        with open('out/data/ship_lookup.json', 'w') as outfile:
-            json.dump(self.ship_lookup, outfile)
-        with open('out/data/solarsystem_lookup.json', 'w') as outfile:
-            json.dump(self.solarsystem_lookup, outfile)
-        with open('out/data/character_lookup.json', 'w') as outfile:
-            json.dump(self.character_lookup, outfile)
-        with open('out/data/corp_lookup.json', 'w') as outfile:
-            json.dump(self.corp_lookup, outfile)
-        with open('out/data/alliance_lookup.json', 'w') as outfile:
-            json.dump(self.alliance_lookup, outfile)
+        #a build that found nothing new skips re-encoding history and re-pickling the snapshot
+        if not self.unsaved_changes():
+            log.info('nothing new to write')
+            return
+        log.info('writing data')
+        if self.sqlite:
+            #only new or changed killmails and ids that were not resolved before
+            self.sqlite.upsert_killmails(self.history.take_dirty())
+            for lookup in LOOKUP_TABLES:
+                self.sqlite.upsert_lookup(lookup, getattr(self, lookup))
+        if not self.sqlite or self.json_export: # the json files are what the gh-pages branch carries between builds
+            self.write_json_file(self.out_dir+'/history.json', self.history.to_list())
+            for lookup in LOOKUP_TABLES:
+                self.write_json_file(self.out_dir+'/'+lookup+'.json', getattr(self, lookup))
+        self.write_json_file(self.out_dir+'/zkill_progress.json', self.most_recent_killID)
+        sections = {'history': self.history, 'zkill_progress': self.most_recent_killID}
+        for lookup in LOOKUP_TABLES:
+            sections[lookup] = getattr(self, lookup)
+        with self.metrics.timer('snapshot'):
+            write_snapshot(self.snapshot_path, sections, self.snapshot_sources())
+        self.history.dirty.clear()
+        self.saved_lookup_sizes = {lookup: len(table) for lookup, table in sections.items() if lookup in LOOKUP_TABLES}
+        self.saved_progress = dict(self.most_recent_killID)
+        self.snapshot_current = True
+
+    def write_json_file(self, path, value):
+        write_if_changed(path, json.dumps(value))
+
+    def render_history(self, history):
+        #swap each day's killmails for its rendered block as the streamed page reaches it,
+        #only days whose content changed since the last build are rendered again
+        for day, daystr, killmails in history:
+            day_html = self.fragments.render([day, [self.history.digest(x['killmail_id']) for x in killmails]],
+                lambda: render_template('day.html', day=day, daystr=daystr, killmails=killmails))
+            yield day, daystr, day_html
+
+    def archive_months(self, history):
+        #YYYY-MM of every month with kills, newest first, from a kills_by_date() list
+        months = []
+        for day, daystr, killmails in history:
+            if not months or months[-1] != day[0:7]:
+                months.append(day[0:7])
+        return months
+
+    def paginate(self, board, month=None, front_page_days=None):
+        #front page is the most recent day blocks, an archive page is one calendar month.
+        #totals in board are left alone so they stay global on every page
+        history = board['history']
+        if month == None:
+            page = history[:front_page_days or self.front_page_days]
+        else:
+            page = [x for x in history if x[0][0:7] == month]
+        return dict(board, history=page, archive_months=self.archive_months(history), archive_month=month)
+
+    def render_board(self, board):
+        #stream the page out as jinja renders it instead of building one big string. the
+        #freezer's relative url_for is only in place during the request, not while the
+        #stream is read, so the page keeps the one it started with
+        return stream_template('index.html', **dict(board, history=self.render_history(board['history']),
+                                                    url_for=app.jinja_env.globals['url_for']))
+
+    def run_stages(self, mail, stages):
+        #run every stage the mail's stamp says is stale, plus the ones after it since
+        #later stages read what earlier ones wrote
+        stamp = mail.setdefault('pipeline', {})
+        stale = False
+        for name, version in stages:
+            if stale or stamp.get(name) != version:
+                stale = True
+                getattr(self, 'stage_'+name)(mail)
+                stamp[name] = version
+
+    def process_pending(self):
+        #only new mails and mails whose stamp predates a stage change go through here,
+        #so a build costs time in proportion to new kills rather than total history
+        pending = self.history.pending_mails()
+        if not pending:
+            return
+        log.info('processing %d new or changed killmails', len(pending))
+        self.metrics.inc('killmails_processed_total', len(pending))
+        with self.metrics.timer('details'):
+            self.update_kill_details(pending)
+        with self.metrics.timer('prune'):
+            for mail in pending:
+                self.run_stages(mail, PIPELINE_STAGES[:1]) # prune first so the name pre-pass sees few attackers
+        with self.metrics.timer('names'):
+            self.resolve_names(pending)
+        with self.metrics.timer('stages'):
+            for mail in pending:
+                self.run_stages(mail, PIPELINE_STAGES)
+                self.history.mark_processed(mail)
+
+    def ingest_package(self, package):
+        #one killfeed package into history as a pending mail, None if none of ours are on it
+        #or it is already stored. only our mails are enriched, everything else is dropped here
+        if package['killID'] in self.history:
+            self.metrics.inc('feed_packages_total', result='known')
+            return None
+        if package.get('killmail') != None:
+            killmail = prune_killmail(package['killmail'], self.our_ids)
+        elif package.get('zkb', {}).get('href'):
+            #newer packages only link the esi killmail: one streamed, rate limited GET per
+            #kill in the game, pruned to our attackers as it is parsed
+            try:
+                killmail = self.stream_esi_killmail(package['zkb']['href'], self.our_ids)
+            except (ValueError, OSError) as error: # requests' errors are OSErrors, a failed fetch must not stop the daemon
+                log.warning('killfeed package %s: fetching its killmail failed (%s), dropped', package['killID'], error)
+                self.metrics.inc('feed_packages_total', result='failed')
+                return None
+        else:
+            log.warning('killfeed package %s has no killmail and no link to one, dropped', package['killID'])
+            self.metrics.inc('feed_packages_total', result='unfilterable')
+            return None
+        if not involves(killmail, self.our_ids):
+            self.metrics.inc('feed_packages_total', result='other')
+            return None
+        zkb = dict(package['zkb'])
+        zkb.pop('href', None) # not part of the zkill character-page entries history is built from
+        mail = {'killmail_id': package['killID'], 'zkb': zkb}
+        mail.update(killmail)
+        mail['ccp_esi'] = True
+        self.history.add(mail)
+        self.metrics.inc('feed_packages_total', result='ours')
+        return mail
 
     def update_all(self):
         if self.zkill_calls:
-            self.update_kill_history()
-        self.update_kill_details()
-        self.prune_unused_history_fields()
-        self.tag_involved_characters()
-        self.tag_as_kill_loss_or_friendly_fire()
-        self.tag_formatted_values()
-        self.tag_solarSystemName()
-        self.tag_shipTypeID()
-        self.write_data_to_file()
+            with self.metrics.timer('crawl'):
+                self.update_kill_history()
+        self.process_pending()
+        with self.metrics.timer('write'):
+            self.write_data_to_file()
 
-    @property
-    def data(self):
+    def view_data(self, view):
         characters = len(self.character_list)
         result = {'kills':           self.kill_counts('row-kill'),
                   'losses':          self.kill_counts('row-loss'),
-                  'history':         self.kills_by_date(),
+                  'history':         self.kills_by_date(view['name']),
                   'characters':      sorted(self.character_list.items()),
                   'money_lost':      self.kill_sums('row-loss'),
                   'money_killed':    self.kill_sums('row-kill'),
                   'friendly_fire':   self.kill_counts('row-friendly_fire'),
                   'character_count': characters,
-                  'board_name':      self.board_name}
+                  'views':           [x for x in self.views if x['enabled']],
+                  'board_name':      self.board_name+view['board_suffix']}
         return result
 
-    @property
-    def pods(self):
-        characters = len(self.character_list)
-        result = {'kills':           self.kill_counts('row-kill'),
-                  'losses':          self.kill_counts('row-loss'),
-                  'history':         self.pod_kills_by_date(),
+    def character_data(self, charid):
+        #board for one of our characters, without touching the shared history
+        charname = self.reverse_character_list.get(str(charid))
+        if charname == None:
+            return None
+        stats = self.character_aggregate(charname)
+        result = {'kills':           stats.count('row-kill'),
+                  'losses':          stats.count('row-loss'),
+                  'history':         stats.kills_by_date('all'),
                   'characters':      sorted(self.character_list.items()),
-                  'money_lost':      self.kill_sums('row-loss'),
-                  'money_killed':    self.kill_sums('row-kill'),
-                  'friendly_fire':   self.kill_counts('row-friendly_fire'),
-                  'character_count': characters,
-                  'board_name':      self.board_name+" Target Pods"}
+                  'money_lost':      self.engineering_number_string(stats.isk('row-loss')),
+                  'money_killed':    self.engineering_number_string(stats.isk('row-kill')),
+                  'friendly_fire':   stats.count('row-friendly_fire'),
+                  'character_count': 1,
+                  'views':           [x for x in self.views if x['enabled']],
+                  'board_name':      charname}
         return result
 
-    @property
-    def targets(self):
-        characters = len(self.character_list)
-        result = {'kills':           self.kill_counts('row-kill'),
-                  'losses':          self.kill_counts('row-loss'),
-                  'history':         self.target_kills_by_date(),
-                  'characters':      sorted(self.character_list.items()),
-                  'money_lost':      self.kill_sums('row-loss'),
-                  'money_killed':    self.kill_sums('row-kill'),
-                  'friendly_fire':   self.kill_counts('row-friendly_fire'),
-                  'character_count': characters,
-                  'board_name':      self.board_name+" Targets"}
+    def stats_data(self):
+        stats = self.analytics()
+        isk = self.engineering_number_string
+        participation = stats.pilot_participation()
+        pilots = []
+        for name, charid in self.character_list.items():
+            kills, share, killed = participation.get(charid, (0, 0.0, 0))
+            pilots.append((name, charid, kills, '%.1f%%' % (share * 100), isk(killed)))
+        pilots.sort(key=lambda x: (-x[2], x[0]))
+        result = {'weeks':           [(self.format_date(day), isk(k), isk(l), isk(rk), isk(rl)) for day, k, l, rk, rl in stats.isk_over_time('week')],
+                  'months':          [(self.format_month(month), isk(k), isk(l)) for month, k, l, rk, rl in stats.isk_over_time('month')],
+                  'systems':         [(theID, name, mails, isk(k), isk(l)) for theID, name, mails, k, l in stats.top_systems()],
+                  'ships':           [(theID, name, kills, isk(k)) for theID, name, kills, k in stats.top_victim_ships()],
+                  'pilots':          pilots,
+                  'rolling_weeks':   ROLLING_WEEKS,
+                  'views':           [x for x in self.views if x['enabled']],
+                  'board_name':      self.board_name+' Statistics'}
         return result
 
+    @property
+    def data(self):
+        return self.view_data(self.view_for_route('/'))
+
+def render_page(board, endpoint, month, front_page_days=None, **values):
+    #one page of a board plus links to its monthly archive pages
+    page = g_zKill.paginate(board, month, front_page_days)
+    if month != None and not page['history']:
+        abort(404)
+    #the template builds the links with url_for so the freezer can make them relative
+    page['page_endpoint'] = endpoint
+    page['page_values'] = values
+    page['archive_links'] = [(g_zKill.format_month(x), x) for x in page['archive_months']]
+    return g_zKill.render_board(page)
+
+def assets():
+    global g_assets
+    if g_assets == None:
+        g_assets = StaticAssets(app.static_folder)
+    return g_assets
+
+@app.template_global()
+@pass_context
+def asset_url(context, filename):
+    #the content hashed copy of a static file when the data api is frozen, the plain one otherwise.
+    #goes through the template's url_for, which the freezer swaps for one making relative urls
+    if app.config['DATA_API']:
+        return context['url_for']('asset', filename=assets().names[filename])
+    return context['url_for']('static', filename=filename)
+
+def intern_names(table):
+    #one copy of every name, shared by the lookup tables and the compact killmails
+    for theID in table:
+        table[theID] = sys.intern(table[theID])
+
+def board_endpoint(view):
+    if view['route'] == '/':
+        return 'index', {}
+    return 'board_view', {'route': view['route'].strip('/')}
+
+@freezer.register_generator
+def board_pages():
+    #a front page and monthly archive pages for every enabled view in data/views.json
+    for view in g_zKill.views:
+        if not view['enabled']:
+            continue
+        endpoint, values = board_endpoint(view)
+        yield endpoint, values
+        for month in g_zKill.archive_months(g_zKill.kills_by_date(view['name'])):
+            yield endpoint, dict(values, month=month)
+    #and for every character, linked from the character list
+    for charid in g_zKill.character_list.values():
+        yield 'character_board', {'charid': charid}
+        character = g_zKill.character_data(charid)
+        for month in g_zKill.archive_months(character['history']):
+            yield 'character_board', {'charid': charid, 'month': month}
+
 @freezer.register_generator
-def index():
-    #build main board
-    yield '/'
-    # build podkills list
-    #yield '/target_pods/' # no longer needed
-    # build ships list
-    yield '/target_ships/'
-
-@app.route('/')
-def index():
-    print('index')
-    return render_template('index.html', **g_zKill.data)
-
-#@app.route('/target_pods/')
-#def target_pods():
-#    print('pods')
-#    return render_template('index.html', **g_zKill.pods)
-
-@app.route('/target_ships/')
-def target_ships():
-    print('targets')
-    return render_template('index.html', **g_zKill.targets)
+def data_api_files():
+    #the data api, the hashed static files and the page that renders from them
+    if not app.config['DATA_API']:
+        return
+    yield 'client_board', {}
+    for filename in g_zKill.data_api().files:
+        yield 'data_api', {'filename': filename}
+    for filename in assets().files:
+        yield 'asset', {'filename': filename}
+
+@app.route('/', defaults={'month': None})
+@app.route('/archive/<month>/')
+def index(month):
+    log.info('index')
+    view = g_zKill.view_for_route('/')
+    return render_page(g_zKill.data, 'index', month, view.get('front_page_days'))
+
+@app.route('/<int:charid>/', defaults={'month': None})
+@app.route('/<int:charid>/archive/<month>/')
+def character_board(charid, month):
+    result = g_zKill.character_data(charid)
+    if result == None:
+        abort(404)
+    log.info('character %s', result['board_name'])
+    return render_page(result, 'character_board', month, charid=charid)
+
+@app.route('/<route>/', defaults={'month': None})
+@app.route('/<route>/archive/<month>/')
+def board_view(route, month):
+    view = g_zKill.view_for_route('/'+route+'/')
+    if view == None:
+        abort(404)
+    log.info(view['name'])
+    return render_page(g_zKill.view_data(view), 'board_view', month, view.get('front_page_days'), route=route)
+
+@app.route('/stats/')
+def stats():
+    log.info('stats')
+    return render_template('stats.html', **g_zKill.stats_data())
+
+def client_board():
+    log.info('client board')
+    return render_template('board.html', board_name=g_zKill.board_name)
+
+def enable_data_api():
+    #these are only routed in this mode: the freezer picks up every route without arguments
+    #and warns about endpoints nothing was frozen for
+    app.config['DATA_API'] = True
+    app.add_url_rule('/board/', 'client_board', client_board)
+    app.add_url_rule('/api/<path:filename>', 'data_api', data_api)
+    app.add_url_rule('/assets/<path:filename>', 'asset', asset)
+
+def data_api(filename):
+    return file_response(g_zKill.data_api().files, filename)
+
+def asset(filename):
+    return file_response(assets().files, filename)
+
+def file_response(files, filename):
+    data = files.get(filename)
+    if data == None:
+        abort(404)
+    #a .gz or .br sibling has the type of the file it compresses, which is what the freezer checks it against
+    return Response(data, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+
+def freeze_all(zKill, report_path, prometheus_path):
+    zKill.fragments.start_build()
+    with zKill.metrics.timer('freeze'):
+        freezer.freeze()
+    zKill.fragments.save()
+    log.info('day blocks rendered: %d, reused: %d', zKill.fragments.misses, zKill.fragments.hits)
+    zKill.metrics.inc('fragment_cache_total', zKill.fragments.hits, result='hit')
+    zKill.metrics.inc('fragment_cache_total', zKill.fragments.misses, result='miss')
+    zKill.metrics.write_json(report_path)
+    if prometheus_path != None:
+        zKill.metrics.write_prometheus(prometheus_path)
+
+def mail_pages(mail):
+    #the pages a new killmail changes the most: every board front page (they all carry the
+    #global totals), the month archive of each view it lands in, the boards of our characters
+    #on it and the stats page. older archive pages catch up on the next full freeze
+    month = mail['killmail_time'][0:7]
+    for view in g_zKill.views:
+        if not view['enabled']:
+            continue
+        endpoint, values = board_endpoint(view)
+        yield endpoint, values
+        if view['predicate'](mail):
+            yield endpoint, dict(values, month=month)
+    for name in g_zKill.history.characters_of(mail['killmail_id']):
+        charid = g_zKill.character_list.get(name)
+        if charid == None:
+            continue # not a characters.json name, it has no board of its own
+        yield 'character_board', {'charid': charid}
+        yield 'character_board', {'charid': charid, 'month': month}
+    yield 'stats', {}
+    if app.config['DATA_API']:
+        for filename in g_zKill.data_api().files:
+            if filename.startswith('manifest.json') or filename.startswith('months/'+month+'.'):
+                yield 'data_api', {'filename': filename}
+
+#(endpoint, values) of the pages the next page_freezer.freeze() builds
+g_refreeze_pages = []
+
+@page_freezer.register_generator
+def refreeze_pages():
+    return g_refreeze_pages
+
+def refreeze(mail):
+    #the pages of one new killmail through the freezer's public freeze(). files it does not
+    #build are the rest of the site, so they are not removed as extra this time
+    g_refreeze_pages[:] = mail_pages(mail)
+    remove_extra = app.config['FREEZER_REMOVE_EXTRA_FILES']
+    app.config['FREEZER_REMOVE_EXTRA_FILES'] = False
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', MissingURLGeneratorWarning) # the other endpoints are left out on purpose
+            return page_freezer.freeze()
+    finally:
+        app.config['FREEZER_REMOVE_EXTRA_FILES'] = remove_extra
+        g_refreeze_pages.clear()
+
+def run_daemon(zKill, feed, full_freeze_interval, report_path, prometheus_path):
+    #poll the killfeed forever, freezing the pages of each of our kills as it arrives.
+    #history is saved and the whole site frozen every full_freeze_interval seconds and on
+    #shutdown; a crash in between loses nothing the next batch crawl would not pick up again
+    def stop(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, stop)
+    log.info('listening on %s', feed.url)
+    last_full_freeze = time.monotonic()
+    try:
+        while True:
+            package = feed.listen()
+            if package == None:
+                zKill.metrics.inc('feed_packages_total', result='empty')
+            else:
+                start = time.perf_counter()
+                mail = zKill.ingest_package(package)
+                if mail != None:
+                    zKill.process_pending()
+                    urls = refreeze(zKill.history.get(mail['killmail_id'])) # the processed record views filter on
+                    zKill.metrics.observe('feed_ingest_seconds', time.perf_counter() - start)
+                    log.info('killmail %s added, %d pages refrozen', mail['killmail_id'], len(urls))
+            if time.monotonic() - last_full_freeze >= full_freeze_interval:
+                zKill.write_data_to_file()
+                freeze_all(zKill, report_path, prometheus_path)
+                last_full_freeze = time.monotonic()
+    finally:
+        log.info('shutting down, saving history and freezing')
+        zKill.write_data_to_file()
+        freeze_all(zKill, report_path, prometheus_path)
+
+def load_boards(path, do_file_cache, zkill_calls, full_crawl, workers, use_sqlite, json_export):
+    #a multi-board build's config lists board roots, each laid out like this repo:
+    #  {"boards": [{"root": "boards/corp"}, {"root": "boards/alliance", "board_name": "Alliance"}]}
+    #  <root>/data (characters, views), <root>/out/data (history, lookups), <root>/out/build (pages)
+    #returns [(zKillAPI, build dir)], every board on one SharedResources
+    with open(path, 'r') as fd:
+        config = json.load(fd)
+    shared = SharedResources(do_file_cache, workers, multi_board=True)
+    boards = []
+    for entry in config['boards']:
+        out_dir = os.path.join(entry['root'], 'out', 'data')
+        build_dir = os.path.join(entry['root'], 'out', 'build')
+        os.makedirs(out_dir, exist_ok=True)
+        zKill = zKillAPI(do_file_cache, zkill_calls, full_crawl, workers, use_sqlite, json_export,
+                         data_dir=os.path.join(entry['root'], 'data'), out_dir=out_dir, shared=shared)
+        if entry.get('board_name') != None:
+            zKill.board_name = entry['board_name']
+        boards.append((zKill, build_dir))
+    return boards
+
+def freeze_board(index):
+    #one board of g_boards, in a worker forked after every board was updated. the
+    #board's pages, day block cache and build dir are its own, so nothing is sent back but counts
+    global g_zKill
+    zKill, build_dir = g_boards[index]
+    g_zKill = zKill
+    app.config['FREEZER_DESTINATION'] = build_dir
+    start = time.perf_counter()
+    zKill.fragments.start_build()
+    pages = len(freezer.freeze())
+    zKill.fragments.save()
+    return {'pages': pages, 'seconds': time.perf_counter() - start, 'hits': zKill.fragments.hits, 'misses': zKill.fragments.misses}
+
+def freeze_boards(boards, freeze_workers):
+    #boards are frozen side by side in forked workers, which see every board as it is in
+    #this process. without fork (windows) they are frozen one after another
+    global g_boards
+    g_boards = boards
+    if 'fork' in multiprocessing.get_all_start_methods() and freeze_workers > 1 and len(boards) > 1:
+        with ProcessPoolExecutor(max_workers=min(freeze_workers, len(boards)), mp_context=multiprocessing.get_context('fork')) as pool:
+            return list(pool.map(freeze_board, range(len(boards))))
+    return [freeze_board(index) for index in range(len(boards))]
+
+def run_boards(boards, freeze_workers, report_path, prometheus_path):
+    metrics = boards[0][0].metrics
+    for zKill, build_dir in boards:
+        log.info('updating %s', zKill.out_dir)
+        zKill.update_all()
+    with metrics.timer('freeze'):
+        results = freeze_boards(boards, freeze_workers)
+    for (zKill, build_dir), result in zip(boards, results):
+        log.info('%s: %d pages in %.1fs, day blocks rendered: %d, reused: %d', build_dir, result['pages'], result['seconds'], result['misses'], result['hits'])
+        metrics.inc('fragment_cache_total', result['hits'], result='hit')
+        metrics.inc('fragment_cache_total', result['misses'], result='miss')
+    metrics.write_json(report_path)
+    if prometheus_path != None:
+        metrics.write_prometheus(prometheus_path)
 
 if __name__ == "__main__":
-    if (len(sys.argv) > 1 and sys.argv[1] == 'debug') or (len(sys.argv) > 2 and sys.argv[2] == 'debug') or (len(sys.argv) > 3 and sys.argv[3] == 'debug'):
-        logging.basicConfig(level=logging.DEBUG)
-    if (len(sys.argv) > 1 and sys.argv[1] == 'no_file_cache') or (len(sys.argv) > 2 and sys.argv[2] == 'no_file_cache') or (len(sys.argv) > 3 and sys.argv[3] == 'no_file_cache'):
-        do_file_cache = False
-    else:
-        do_file_cache = True
-    if (len(sys.argv) > 1 and sys.argv[1] == 'no_zkill_calls') or (len(sys.argv) > 2 and sys.argv[2] == 'no_zkill_calls') or (len(sys.argv) > 3 and sys.argv[3] == 'no_zkill_calls'):
-        zkill_calls = False
-    else:
-        zkill_calls = True
-    print('main build')
-    zKill = zKillAPI(do_file_cache, zkill_calls)
+    args = sys.argv[1:]
+    logging.basicConfig(level=logging.DEBUG if 'debug' in args else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    do_file_cache = 'no_file_cache' not in args
+    zkill_calls = 'no_zkill_calls' not in args
+    full_crawl = 'full_crawl' in args # ignore high-water marks and walk every zkill page
+    use_sqlite = 'sqlite' in args # keep history and lookups in out/data/board.sqlite
+    json_export = 'json_export' in args # with sqlite, also write the json files the gh-pages branch carries
+    workers = 8 # concurrent esi fetches, override with workers=N
+    report_path = 'build_report.json' # timings and counters of this build, override with report=PATH
+    prometheus_path = None # also write them as a prometheus textfile with prometheus=PATH
+    daemon = 'daemon' in args # after the build keep running on the killfeed
+    if 'data_api' in args: # month shards, hashed assets and the client rendered /board/
+        enable_data_api()
+    boards_path = None # build every board listed in this file in one process, see load_boards()
+    freeze_workers = os.cpu_count() or 1 # boards frozen at once, override with freeze_workers=N
+    feed_url = REDISQ_URL # killfeed to listen on, override with feed=URL
+    queue_id = 'polyhedra-board' # killfeed consumer id, override with queue=ID
+    full_freeze_interval = 3600 # seconds between full freezes and saves in daemon mode, override with full_freeze=N
+    for arg in args:
+        if arg.startswith('workers='):
+            workers = int(arg[len('workers='):])
+        elif arg.startswith('report='):
+            report_path = arg[len('report='):]
+        elif arg.startswith('prometheus='):
+            prometheus_path = arg[len('prometheus='):]
+        elif arg.startswith('feed='):
+            feed_url = arg[len('feed='):]
+        elif arg.startswith('queue='):
+            queue_id = arg[len('queue='):]
+        elif arg.startswith('full_freeze='):
+            full_freeze_interval = int(arg[len('full_freeze='):])
+        elif arg.startswith('boards='):
+            boards_path = arg[len('boards='):]
+        elif arg.startswith('freeze_workers='):
+            freeze_workers = int(arg[len('freeze_workers='):])
+    if boards_path != None:
+        if daemon:
+            sys.exit('daemon mode runs a single board')
+        log.info('multi-board build')
+        run_boards(load_boards(boards_path, do_file_cache, zkill_calls, full_crawl, workers, use_sqlite, json_export),
+                   freeze_workers, report_path, prometheus_path)
+        sys.exit(0)
+    log.info('main build')
+    zKill = zKillAPI(do_file_cache, zkill_calls, full_crawl, workers, use_sqlite, json_export)
     zKill.update_all()
-    print('update success')
-    print('latest ID: '+str(zKill.kills_by_date()[0][2][0]['killmail_id']))
+    log.info('update success')
+    log.info('latest ID: %s', zKill.kills_by_date()[0][2][0]['killmail_id'])
     g_zKill = zKill
-    freezer.freeze()
+    freeze_all(zKill, report_path, prometheus_path)
+    if daemon:
+        feed = KillFeed(zKill.http, feed_url, queue_id)
+        run_daemon(zKill, feed, full_freeze_interval, report_path, prometheus_path)
 
     #app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(ROOT, 'data')
+sys.path.insert(0, ROOT)
+
+import app
+from ratelimit import TokenBucket
+from synth import generate, merged
+from stub_server import StubServer
+
+#times each stage of a build against synthetic data, no live zkill/esi and no rate limit sleeps.
+#  python bench/run.py [mails=N] [fetch=N] [seed=N] [workers=N] [output=FILE] [compare=FILE]
+#                      [errors=RATE] [no_tracemalloc] [no_freeze] [keep] [verbose]
+#mails   size of the synthetic history run through the stages, stored, loaded (from the snapshot and the json), aggregated and frozen (10000)
+#fetch   killmails crawled and fetched from the local stub server over http (1000)
+#errors  share of stub server calls that fail with a 503, to time the retry path (0)
+#output  write the results as json, compare reads such a file and prints the change per stage
+#peak memory comes from tracemalloc, which slows everything down; no_tracemalloc times without it
+
+MB = 1024.0 * 1024.0
+
+class Recorder():
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def run(self, name, fn, *args):
+        #wall time, peak memory above the stage's starting point and memory still held after it
+        if self.trace_memory:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds = time.perf_counter() - start
+        entry = {'stage': name, 'seconds': round(seconds, 4)}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            entry['peak_mb'] = round((peak - before) / MB, 2)
+            entry['retained_mb'] = round((current - before) / MB, 2)
+        self.results.append(entry)
+        print(format_row(entry), flush=True)
+        return result
+
+def format_row(entry, baseline=None):
+    row = '%-28s %10.3fs' % (entry['stage'], entry['seconds'])
+    if 'peak_mb' in entry:
+        row += ' %10.1f MB peak %10.1f MB retained' % (entry['peak_mb'], entry['retained_mb'])
+    if baseline != None and baseline.get('seconds'):
+        row += ' %+8.1f%%' % ((entry['seconds'] - baseline['seconds']) * 100.0 / baseline['seconds'])
+    return row
+
+def unthrottle(zKill):
+    #the stub server is local, the polite limits would only measure time.sleep
+    zKill.zkill_bucket = TokenBucket(rate=1e9, burst=1e9)
+    zKill.esi_bucket = TokenBucket(rate=1e9, burst=1e9)
+    zKill.esi_error_limit.bucket = zKill.esi_bucket
+
+def process(recorder, zKill, prefix):
+    #the steps of zKillAPI.process_pending, timed one by one
+    pending = zKill.history.pending_mails()
+    recorder.run(prefix+'details', zKill.update_kill_details, pending)
+    recorder.run(prefix+'prune', lambda: [zKill.run_stages(mail, app.PIPELINE_STAGES[:1]) for mail in pending])
+    recorder.run(prefix+'names', zKill.resolve_names, pending)
+    def stages():
+        for mail in pending:
+            zKill.run_stages(mail, app.PIPELINE_STAGES)
+            zKill.history.mark_processed(mail)
+    recorder.run(prefix+'stages', stages)
+
+def bench_network(recorder, options, our_ids, targets, work_dir):
+    #crawl, esi fetches and name resolution over real http against the stub server
+    universe, mails = generate(options['fetch'], our_ids, targets, seed=options['seed']+1, days=90)
+    server = StubServer(universe, mails, options['errors']).start()
+    out_dir = os.path.join(work_dir, 'network')
+    os.makedirs(out_dir)
+    try:
+        zKill = app.zKillAPI(False, True, workers=options['workers'], data_dir=DATA_DIR, out_dir=out_dir,
+                             zkill_api=server.zkill_api, esi_api=server.esi_api)
+        unthrottle(zKill)
+        recorder.run('network.crawl', zKill.update_kill_history)
+        process(recorder, zKill, 'network.')
+    finally:
+        server.stop()
+    print('  stub server calls: '+json.dumps(dict(server.requests), sort_keys=True))
+
+def bench_history(recorder, options, our_ids, targets, work_dir):
+    #everything after the network on a large history: stages, json store/load, aggregation, freeze
+    universe, mails = generate(options['mails'], our_ids, targets, seed=options['seed'])
+    out_dir = os.path.join(work_dir, 'history')
+    os.makedirs(out_dir)
+    #a previous build that had already resolved every name, so the stages never leave the process
+    for lookup, table in universe.lookup_tables().items():
+        with open(os.path.join(out_dir, lookup+'.json'), 'w') as fd:
+            json.dump(table, fd)
+    zKill = app.zKillAPI(False, False, data_dir=DATA_DIR, out_dir=out_dir)
+    unmerged = [merged(zkb, esi, zKill.our_ids) for zkb, esi in mails]
+    del mails
+    def add():
+        for mail in unmerged:
+            zKill.history.add(mail)
+    recorder.run('history.store_add', add)
+    del unmerged
+    process(recorder, zKill, 'history.')
+    recorder.run('history.json_store', zKill.write_data_to_file)
+    del zKill
+    snapshot = recorder.run('history.snapshot_load', lambda: app.zKillAPI(False, False, data_dir=DATA_DIR, out_dir=out_dir))
+    assert snapshot.snapshot != None, 'snapshot not used'
+    del snapshot
+    os.remove(os.path.join(out_dir, 'state.snapshot'))
+    zKill = recorder.run('history.json_load', lambda: app.zKillAPI(False, False, data_dir=DATA_DIR, out_dir=out_dir))
+    app.g_zKill = zKill
+    recorder.run('board.aggregate', lambda: [zKill.view_data(view) for view in zKill.views if view['enabled']])
+    recorder.run('board.characters', lambda: [zKill.character_data(x) for x in zKill.character_list.values()])
+    recorder.run('board.analytics', zKill.stats_data)
+    if options['freeze']:
+        app.app.config['FREEZER_DESTINATION'] = os.path.join(work_dir, 'build')
+        recorder.run('freeze.cold', app.freezer.freeze)
+        recorder.run('freeze.warm', app.freezer.freeze) #every day block comes from the fragment cache
+        zKill.fragments.save()
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args(args):
+    options = {'mails': 10000, 'fetch': 1000, 'seed': 1, 'workers': 8, 'errors': 0.0, 'output': None, 'compare': None,
+               'tracemalloc': 'no_tracemalloc' not in args, 'freeze': 'no_freeze' not in args,
+               'keep': 'keep' in args, 'verbose': 'verbose' in args}
+    for arg in args:
+        key, sep, value = arg.partition('=')
+        if sep and key in ('mails', 'fetch', 'seed', 'workers'):
+            options[key] = int(value)
+        elif sep and key == 'errors':
+            options[key] = float(value)
+        elif sep and key in ('output', 'compare'):
+            options[key] = value
+    return options
+
+if __name__ == "__main__":
+    options = parse_args(sys.argv[1:])
+    with open(os.path.join(DATA_DIR, 'characters.json'), 'r') as fd:
+        our_ids = list(json.load(fd).values())
+    with open(os.path.join(DATA_DIR, 'target_alliances.json'), 'r') as fd:
+        targets = json.load(fd)
+    work_dir = tempfile.mkdtemp(prefix='polyhedra-bench-')
+    print('benchmark: '+str(options['mails'])+' mails, '+str(options['fetch'])+' fetched, work dir '+work_dir)
+    #the build logs a line per page and, with verbose, per network call
+    logging.basicConfig(level=logging.DEBUG if options['verbose'] else logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+    recorder = Recorder(options['tracemalloc'])
+    if options['tracemalloc']:
+        tracemalloc.start()
+    try:
+        if options['fetch'] > 0:
+            bench_network(recorder, options, our_ids, targets, work_dir)
+        bench_history(recorder, options, our_ids, targets, work_dir)
+    finally:
+        if not options['keep']:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    report = {'commit':      git_commit(),
+              'python':      platform.python_version(),
+              'mails':       options['mails'],
+              'fetch':       options['fetch'],
+              'seed':        options['seed'],
+              'workers':     options['workers'],
+              'tracemalloc': options['tracemalloc'],
+              'stages':      recorder.results}
+    if options['output'] != None:
+        with open(options['output'], 'w') as fd:
+            json.dump(report, fd, indent=2)
+    if options['compare'] != None:
+        with open(options['compare'], 'r') as fd:
+            previous = json.load(fd)
+        baseline = {x['stage']: x for x in previous['stages']}
+        print('compared with '+str(previous.get('commit'))+' ('+str(previous['mails'])+' mails):')
+        for entry in recorder.results:
+            print(format_row(entry, baseline.get(entry['stage'])))
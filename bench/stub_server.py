@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import json
+import random
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#local stand-in for the zkill and esi endpoints zKillAPI calls, serving a synthetic
+#universe from synth.py. point zKillAPI(zkill_api=server.zkill_api, esi_api=server.esi_api) at it
+#  GET  /api/characterID/<id>/no-items/page/<n>/         zkill character page, newest first
+#  GET  /latest/killmails/<id>/<hash>/                   esi killmail body
+#  POST /latest/universe/names/                          bulk names, 404 if any id is unknown
+#  GET  /latest/{alliances,corporations,characters}/<id>/, /latest/universe/{systems,types}/<id>/
+#  GET  /listen.php                                      redisq killfeed, one push()ed kill per poll or a null package
+#bodies are gzipped when asked for, GETs carry an ETag and answer If-None-Match with a 304,
+#and error_rate makes that share of calls fail with a 503 and Retry-After: 0
+
+ZKILL_PAGE_SIZE = 200
+#esi reports its error budget on every response, keep it well clear of ESIErrorLimit's floor
+ESI_HEADERS = {'X-Esi-Error-Limit-Remain': '100', 'X-Esi-Error-Limit-Reset': '60'}
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass #clients dropping a keep-alive connection mid-retry is expected
+
+class StubServer():
+    def __init__(self, universe, mails, error_rate=0.0, seed=1):
+        self.universe = universe
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.killmails = {}
+        pages = defaultdict(list)
+        for zkb, esi in reversed(mails): #zkill lists newest first
+            self.killmails[(esi['killmail_id'], zkb['zkb']['hash'])] = esi
+            involved = set(x.get('character_id') for x in esi['attackers'])
+            involved.add(esi['victim'].get('character_id'))
+            for theID in involved:
+                pages[theID].append(zkb)
+        self.pages = pages
+        self.requests = defaultdict(int) #endpoint -> number of calls served
+        self.httpd = QuietHTTPServer(('127.0.0.1', 0), make_handler(self))
+        base = 'http://127.0.0.1:%d/' % self.httpd.server_address[1]
+        self.zkill_api = base+'api/'
+        self.esi_api = base+'latest/'
+        self.feed_url = base+'listen.php'
+        self.feed = deque()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def fail(self):
+        with self.lock:
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.requests['injected_errors'] += 1
+                return True
+        return False
+
+    def push(self, zkb, esi):
+        #queue a kill on the killfeed, as a synth.generate pair
+        package = {'killID': esi['killmail_id'], 'killmail': esi, 'zkb': zkb['zkb']}
+        with self.lock:
+            self.killmails[(esi['killmail_id'], zkb['zkb']['hash'])] = esi
+            self.feed.append(package)
+
+    def listen(self):
+        #no long poll, an empty feed answers at once so clients are not held for ttw seconds
+        with self.lock:
+            return {'package': self.feed.popleft() if self.feed else None}
+
+    def zkill_page(self, theID, page):
+        start = (page - 1) * ZKILL_PAGE_SIZE
+        return self.pages.get(theID, [])[start:start + ZKILL_PAGE_SIZE]
+
+    def names(self, ids):
+        result = []
+        for theID in ids:
+            if theID not in self.universe.names:
+                return None
+            name, category = self.universe.names[theID]
+            result.append({'id': theID, 'name': name, 'category': category})
+        return result
+
+    def name(self, theID):
+        entry = self.universe.names.get(theID)
+        return None if entry == None else {'name': entry[0]}
+
+    def get(self, path):
+        #(status, body) for a GET path with the query string already removed
+        parts = [x for x in path.split('/') if x]
+        if parts == ['listen.php']:
+            self.requests['redisq'] += 1
+            return 200, self.listen()
+        if parts[:2] == ['api', 'characterID'] and len(parts) == 6:
+            self.requests['zkill_page'] += 1
+            return 200, self.zkill_page(int(parts[2]), int(parts[5]))
+        if parts[:2] == ['latest', 'killmails'] and len(parts) == 4:
+            self.requests['esi_killmail'] += 1
+            body = self.killmails.get((int(parts[2]), parts[3]))
+            return (404, {'error': 'Invalid killmail_id and/or killmail_hash'}) if body == None else (200, body)
+        if parts[0] == 'latest' and len(parts) in (3, 4):
+            self.requests['esi_name'] += 1
+            body = self.name(int(parts[-1]))
+            return (404, {'error': 'Not found'}) if body == None else (200, body)
+        return 404, {'error': 'Unknown endpoint'}
+
+    def post(self, path, payload):
+        if path.strip('/') == 'latest/universe/names':
+            self.requests['esi_names'] += 1
+            body = self.names(payload)
+            return (404, {'error': 'Ensure all IDs are valid before resolving.'}) if body == None else (200, body)
+        return 404, {'error': 'Unknown endpoint'}
+
+def make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' # keep-alive, the same as the real apis
+
+        def do_GET(self):
+            if server.fail():
+                return self.reply(503, {'error': 'Service Unavailable'}, {'Retry-After': '0'})
+            status, body = server.get(self.path.split('?')[0])
+            data = json.dumps(body).encode()
+            etag = '"'+hashlib.sha1(data).hexdigest()+'"'
+            if status == 200 and self.headers.get('If-None-Match') == etag:
+                return self.reply(304, None, {'ETag': etag})
+            self.reply(status, body, {'ETag': etag} if status == 200 else {})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'null')
+            if server.fail():
+                return self.reply(503, {'error': 'Service Unavailable'}, {'Retry-After': '0'})
+            self.reply(*server.post(self.path.split('?')[0], payload))
+
+        def reply(self, status, body, headers={}):
+            data = b'' if status == 304 else json.dumps(body).encode()
+            self.send_response(status)
+            if data and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                data = gzip.compress(data)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in dict(ESI_HEADERS, **headers).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass #one line per request would drown the report
+    return Handler
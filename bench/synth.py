@@ -0,0 +1,122 @@
+import random
+from datetime import datetime, timedelta
+
+from ingest import prune_killmail
+
+#deterministic synthetic killmails for the benchmarks. each mail comes as the zkill
+#character-page entry and the esi killmail body it points at, the same two halves
+#update_kill_history and fetch_kill_details put together
+
+POD_TYPE = 670
+
+class Universe():
+    #id pools the generator draws from, with a name for every id so the stub server
+    #can answer /universe/names/ and the lookup tables can be filled without it
+    def __init__(self, rng, our_ids, target_alliances=()):
+        self.our_ids = list(our_ids)
+        self.characters = [2100000000 + x for x in range(4000)]
+        self.corporations = [98000000 + x for x in range(300)]
+        self.alliances = list(target_alliances) + [99000000 + x for x in range(80)]
+        self.ship_types = [POD_TYPE] + [580 + x for x in range(60)]
+        self.systems = [30000001 + x for x in range(400)]
+        #a pilot stays in one corp and alliance, so the same names repeat the way they do on a real board
+        self.membership = {}
+        for theID in self.characters + self.our_ids:
+            corp = rng.choice(self.corporations)
+            self.membership[theID] = (corp, self.alliances[corp % len(self.alliances)])
+        self.names = {}
+        for category, ids in (('character', self.characters + self.our_ids), ('corporation', self.corporations),
+                              ('alliance', self.alliances), ('inventory_type', self.ship_types),
+                              ('solar_system', self.systems)):
+            for theID in ids:
+                self.names[theID] = (category.replace('_', ' ').title()+' '+str(theID), category)
+
+    def lookup_tables(self):
+        #the five lookup tables zKillAPI keeps, as a build that had already resolved every id
+        tables = {'character': {}, 'corporation': {}, 'alliance': {}, 'inventory_type': {}, 'solar_system': {}}
+        for theID, (name, category) in self.names.items():
+            tables[category][str(theID)] = name
+        return {'character_lookup':   tables['character'],
+                'corp_lookup':        tables['corporation'],
+                'alliance_lookup':    tables['alliance'],
+                'ship_lookup':        tables['inventory_type'],
+                'solarsystem_lookup': tables['solar_system']}
+
+def attacker_count(rng):
+    #mostly small gangs with a long tail of large fights, capped like a busy fleet fight
+    return min(1 + int(rng.lognormvariate(1.0, 1.1)), 500)
+
+def pilot(universe, theID):
+    corp, alliance = universe.membership[theID]
+    return {'character_id': theID, 'corporation_id': corp, 'alliance_id': alliance}
+
+def make_killmail(rng, universe, killmail_id, when):
+    kind = rng.random()
+    count = attacker_count(rng)
+    ours = rng.sample(universe.our_ids, min(len(universe.our_ids), 1 + int(rng.expovariate(0.8))))
+    if kind < 0.80: #kill, our characters on the attacker list
+        victim_id = rng.choice(universe.characters)
+        attacker_ids = ours + rng.sample(universe.characters, max(count - len(ours), 0))
+    elif kind < 0.98: #loss, one of ours is the victim
+        victim_id = ours[0]
+        attacker_ids = rng.sample(universe.characters, count)
+    else: #friendly fire, one of ours shot another
+        ours = rng.sample(universe.our_ids, 2)
+        victim_id = ours[0]
+        attacker_ids = ours[1:] + rng.sample(universe.characters, count)
+    attacker_ids = attacker_ids[:count] or [rng.choice(universe.characters)]
+    final = rng.randrange(len(attacker_ids))
+    attackers = []
+    for index, theID in enumerate(attacker_ids):
+        attacker = pilot(universe, theID)
+        attacker.update({'damage_done': rng.randrange(50, 5000),
+                         'final_blow': index == final,
+                         'security_status': round(rng.uniform(-10, 5), 1),
+                         'ship_type_id': rng.choice(universe.ship_types),
+                         'weapon_type_id': rng.randrange(2000, 3000)})
+        attackers.append(attacker)
+    victim = pilot(universe, victim_id)
+    victim.update({'damage_taken': sum(x['damage_done'] for x in attackers),
+                   'ship_type_id': POD_TYPE if rng.random() < 0.2 else rng.choice(universe.ship_types[1:]),
+                   'items': [{'flag': 5, 'item_type_id': rng.randrange(2000, 3000), 'quantity_dropped': 1, 'singleton': 0}
+                             for x in range(rng.randrange(0, 12))],
+                   'position': {'x': rng.uniform(-1e12, 1e12), 'y': rng.uniform(-1e12, 1e12), 'z': rng.uniform(-1e12, 1e12)}})
+    esi = {'attackers':       attackers,
+           'killmail_id':     killmail_id,
+           'killmail_time':   when.strftime('%Y-%m-%dT%H:%M:%SZ'),
+           'solar_system_id': rng.choice(universe.systems),
+           'victim':          victim}
+    value = round(rng.lognormvariate(17.5, 1.6), 2)
+    zkb = {'killmail_id': killmail_id,
+           'zkb': {'locationID':     40000000 + rng.randrange(100000),
+                   'hash':           '%040x' % rng.getrandbits(160),
+                   'fittedValue':    round(value * 0.6, 2),
+                   'droppedValue':   round(value * 0.3, 2),
+                   'destroyedValue': round(value * 0.7, 2),
+                   'totalValue':     value,
+                   'points':         rng.randrange(1, 100),
+                   'npc':            False,
+                   'solo':           count == 1,
+                   'awox':           False,
+                   'labels':         ['pvp', 'loc:nullsec']}}
+    return zkb, esi
+
+def generate(count, our_ids, target_alliances=(), seed=1, days=730, end=datetime(2023, 6, 1)):
+    #[(zkb entry, esi killmail)] oldest first, spread evenly over the last `days` days
+    rng = random.Random(seed)
+    universe = Universe(rng, our_ids, target_alliances)
+    start = end - timedelta(days=days)
+    step = days * 86400 / max(count, 1)
+    mails = []
+    for index in range(count):
+        when = start + timedelta(seconds=int(index * step + rng.uniform(0, step)))
+        mails.append(make_killmail(rng, universe, 100000000 + index, when))
+    return universe, mails
+
+def merged(zkb, esi, our_ids):
+    #what a killmail looks like once update_kill_details has merged the (pruned) esi
+    #body into the zkill entry, before any pipeline stage has run
+    mail = dict(zkb, zkb=dict(zkb['zkb']))
+    mail.update(prune_killmail(esi, our_ids))
+    mail['ccp_esi'] = True
+    return mail
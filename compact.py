@@ -0,0 +1,255 @@
+import sys
+from datetime import datetime, timezone
+
+#compact in-memory form of a fully processed killmail. the fields every page reads are
+#pulled out of the nested dicts into slots (ids as ints, time as epoch seconds, row_type
+#as a small int, names interned) and whatever is left stays in one 'extra' dict, so
+#to_dict() gives back exactly the dict the record was built from. the kept attackers are
+#held as (keys, values) tuples with one shared keys tuple per layout. records are read-only,
+#mails that still have to go through the stages are kept as plain dicts
+
+class Missing():
+    #marks an empty slot, as opposed to a key whose value is None
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        return 'MISSING' #unpickles to the module's single instance
+
+MISSING = Missing()
+
+ROW_TYPES = ('row-kill', 'row-loss', 'row-friendly_fire')
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+#slot name -> (part of the killmail it lives in, key in that part). part None is the top level.
+#slot names never equal a killmail key, jinja falls back to attributes for missing keys
+FIELDS = {
+    'id':                      (None, 'killmail_id'),
+    'epoch':                   (None, 'killmail_time'),
+    'system_id':               (None, 'solar_system_id'),
+    'system_name':             (None, 'solar_system_name'),
+    'row':                     (None, 'row_type'),
+    'ours':                    (None, 'our_characters'),
+    'involved_count':          (None, 'involved'),
+    'minutes':                 (None, 'minutes_into_day'),
+    'price_text':              (None, 'formatted_price'),
+    'esi_done':                (None, 'ccp_esi'),
+    'stamp':                   (None, 'pipeline'),
+    'attacker_list':           (None, 'attackers'),
+    'victim_character_id':     ('victim', 'character_id'),
+    'victim_character_name':   ('victim', 'character_name'),
+    'victim_corporation_id':   ('victim', 'corporation_id'),
+    'victim_corporation_name': ('victim', 'corporation_name'),
+    'victim_alliance_id':      ('victim', 'alliance_id'),
+    'victim_alliance_name':    ('victim', 'alliance_name'),
+    'victim_ship_type_id':     ('victim', 'ship_type_id'),
+    'victim_ship_type_name':   ('victim', 'ship_type_name'),
+    'final_character_id':      ('final_blow', 'character_id'),
+    'final_character_name':    ('final_blow', 'character_name'),
+    'final_corporation_id':    ('final_blow', 'corporation_id'),
+    'final_alliance_id':       ('final_blow', 'alliance_id'),
+    'final_alliance_name':     ('final_blow', 'alliance_name'),
+    'final_flag':              ('final_blow', 'final_blow'),
+    'total_value':             ('zkb', 'totalValue'),
+    'zkb_hash':                ('zkb', 'hash'),
+    'zkb_npc':                 ('zkb', 'npc'),
+    'zkb_solo':                ('zkb', 'solo'),
+    'zkb_location_id':         ('zkb', 'locationID'),
+    'zkb_fitted_value':        ('zkb', 'fittedValue'),
+    'zkb_dropped_value':       ('zkb', 'droppedValue'),
+    'zkb_destroyed_value':     ('zkb', 'destroyedValue'),
+    'zkb_labels':              ('zkb', 'labels'),
+}
+NAME_SLOTS = frozenset(('system_name', 'victim_character_name', 'victim_corporation_name',
+                        'victim_alliance_name', 'victim_ship_type_name', 'final_character_name', 'final_alliance_name'))
+PARTS = ('victim', 'final_blow', 'zkb')
+TOP_LEVEL_SLOTS = {key: slot for slot, (part, key) in FIELDS.items() if part == None}
+PART_SLOTS = {part: {key: slot for slot, (p, key) in FIELDS.items() if p == part} for part in PARTS}
+#what is left of each part once its slotted keys are taken out, MISSING if the mail has no such part
+REST_SLOTS = {'victim': 'victim_rest', 'final_blow': 'final_rest', 'zkb': 'zkb_rest'}
+
+#shared by every record with nothing left over, never mutated
+EMPTY = {}
+
+#stage stamps, zkb labels and attacker layouts repeat across thousands of mails, keep one shared copy of each
+shared_values = {}
+
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+def encode_time(value):
+    #epoch seconds, or MISSING if the string would not survive the round trip
+    if type(value) != str or len(value) != 20 or value[-1] != 'Z':
+        return MISSING
+    try:
+        epoch = int(datetime.fromisoformat(value[:-1]).replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return MISSING
+    if decode_time(epoch) != value:
+        return MISSING
+    return epoch
+
+def decode_time(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(TIME_FORMAT)
+
+def compact_attacker(attacker):
+    keys = tuple(attacker)
+    keys = shared_values.setdefault(('attacker',) + keys, keys)
+    return (keys, tuple(sys.intern(x) if type(x) == str else x for x in attacker.values()))
+
+def is_compact(mail):
+    return type(mail) == CompactKillmail
+
+def as_dict(mail):
+    return mail.to_dict() if type(mail) == CompactKillmail else mail
+
+class CompactKillmail():
+    __slots__ = tuple(FIELDS) + tuple(REST_SLOTS.values()) + ('extra',)
+
+    def __init__(self, mail):
+        extra = {}
+        for slot in self.__slots__:
+            setattr(self, slot, MISSING)
+        for key, value in mail.items():
+            if key in PART_SLOTS:
+                if type(value) != dict:
+                    extra[key] = value
+                    continue
+                slots = PART_SLOTS[key]
+                rest = {}
+                for part_key, part_value in value.items():
+                    if part_key in slots and self.store(slots[part_key], part_value):
+                        continue
+                    rest[part_key] = part_value
+                setattr(self, REST_SLOTS[key], rest or EMPTY)
+            elif key in TOP_LEVEL_SLOTS and self.store(TOP_LEVEL_SLOTS[key], value):
+                continue
+            elif key == 'our_involved_html' and value == '<BR>'.join(mail.get('our_characters') or []):
+                continue #rebuilt from our_characters
+            else:
+                extra[key] = value
+        self.extra = extra or EMPTY
+
+    def store(self, slot, value):
+        #returns False when the value has to stay in extra to round trip exactly
+        if slot == 'epoch':
+            value = encode_time(value)
+            if value is MISSING:
+                return False
+        elif slot == 'row':
+            if value not in ROW_TYPES:
+                return False
+            value = ROW_TYPES.index(value)
+        elif slot == 'ours':
+            if type(value) != list:
+                return False
+            value = tuple(sys.intern(x) if type(x) == str else x for x in value)
+        elif slot == 'stamp':
+            if type(value) != dict:
+                return False
+            value = shared_values.setdefault(('stamp',) + tuple(sorted(value.items())), value)
+        elif slot == 'zkb_labels':
+            if type(value) != list:
+                return False
+            value = tuple(value)
+            value = shared_values.setdefault(('labels',) + value, value)
+        elif slot == 'attacker_list':
+            if type(value) != list or any(type(x) != dict for x in value):
+                return False
+            if any(type(x) not in SCALAR_TYPES for attacker in value for x in attacker.values()):
+                return False
+            value = tuple(compact_attacker(attacker) for attacker in value)
+        elif slot in NAME_SLOTS and type(value) == str:
+            value = sys.intern(value)
+        setattr(self, slot, value)
+        return True
+
+    def load(self, slot):
+        value = getattr(self, slot)
+        if value is MISSING:
+            return value
+        if slot == 'epoch':
+            return decode_time(value)
+        if slot == 'row':
+            return ROW_TYPES[value]
+        if slot == 'ours':
+            return list(value)
+        if slot == 'stamp':
+            return dict(value)
+        if slot == 'zkb_labels':
+            return list(value)
+        if slot == 'attacker_list':
+            return [dict(zip(keys, values)) for keys, values in value]
+        return value
+
+    #read-only mapping protocol, enough for the board code and jinja to use it like the dict
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in PART_SLOTS:
+            if getattr(self, REST_SLOTS[key]) is not MISSING:
+                return KillmailPart(self, key)
+            return self.extra.get(key, default)
+        if key in TOP_LEVEL_SLOTS:
+            value = self.load(TOP_LEVEL_SLOTS[key])
+            if value is not MISSING:
+                return value
+        if key == 'our_involved_html' and key not in self.extra and self.ours is not MISSING:
+            return '<BR>'.join(self.ours)
+        return self.extra.get(key, default)
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def to_dict(self):
+        mail = {}
+        for key, slot in TOP_LEVEL_SLOTS.items():
+            value = self.load(slot)
+            if value is not MISSING:
+                mail[key] = value
+        if self.ours is not MISSING and 'our_involved_html' not in self.extra:
+            mail['our_involved_html'] = '<BR>'.join(self.ours)
+        for key in PART_SLOTS:
+            if getattr(self, REST_SLOTS[key]) is not MISSING:
+                mail[key] = KillmailPart(self, key).to_dict()
+        mail.update(self.extra)
+        return mail
+
+class KillmailPart():
+    #the victim, final_blow or zkb sub-dict of a CompactKillmail
+    __slots__ = ('mail', 'part')
+
+    def __init__(self, mail, part):
+        self.mail = mail
+        self.part = part
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        slot = PART_SLOTS[self.part].get(key)
+        if slot != None:
+            value = self.mail.load(slot)
+            if value is not MISSING:
+                return value
+        return getattr(self.mail, REST_SLOTS[self.part]).get(key, default)
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def to_dict(self):
+        part = {}
+        for key, slot in PART_SLOTS[self.part].items():
+            value = self.mail.load(slot)
+            if value is not MISSING:
+                part[key] = value
+        part.update(getattr(self.mail, REST_SLOTS[self.part]))
+        return part
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+
+def write_if_changed(path, text):
+    #leave files whose bytes would not change alone, so their mtime survives and
+    #the deploy diff only sees real changes. writes go through a temp file and a swap
+    #so a crash mid-write never leaves a truncated file. returns True if written
+    data = text if type(text) == bytes else text.encode('utf-8')
+    try:
+        with open(path, 'rb') as fd:
+            if fd.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path+'.tmp', 'wb') as outfile:
+        outfile.write(data)
+    os.replace(path+'.tmp', path)
+    return True
+
+class FragmentCache():
+    #rendered html for each day block, keyed by a hash of the template that renders it and
+    #of the content hashes of that day's killmails in order (KillmailStore.digest). kept
+    #between builds in a local file that is never published (the deploy caches it on the runner).
+    #entries not used by a build are dropped when it is saved
+    def __init__(self, path, template_path):
+        self.path = path
+        with open(template_path, 'rb') as fd:
+            self.template_hash = hashlib.sha1(fd.read()).hexdigest()
+        try:
+            with open(path, 'r') as fd:
+                self.fragments = json.load(fd)
+        except (FileNotFoundError, ValueError):
+            self.fragments = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def start_build(self):
+        #forget what earlier builds in this process used, save() keeps only this build's blocks
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, content):
+        digest = hashlib.sha1(self.template_hash.encode())
+        digest.update(json.dumps(content, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def render(self, content, render_fn):
+        key = self.key(content)
+        self.used.add(key)
+        html = self.fragments.get(key)
+        if html == None:
+            self.misses += 1
+            html = render_fn()
+            self.fragments[key] = html
+        else:
+            self.hits += 1
+        return html
+
+    def save(self):
+        self.fragments = {key: self.fragments[key] for key in self.used if key in self.fragments}
+        write_if_changed(self.path, json.dumps(self.fragments, sort_keys=True))
@@ -0,0 +1,147 @@
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from cachecontrol.adapter import CacheControlAdapter
+from cachecontrol.caches.file_cache import FileCache
+
+#statuses worth another try: esi's error limit (420), rate limiting and server side trouble
+RETRY_STATUSES = frozenset((420, 429, 500, 502, 503, 504))
+USER_AGENT = 'polyhedra-board (+https://github.com/DuskDragon/polyhedra-board)'
+
+log = logging.getLogger('polyhedra')
+
+class ThrottledAdapter(HTTPAdapter):
+    #takes the rate limit token only once a request is really going on the wire,
+    #so answers served fresh from the cache never wait on or spend one
+    def send(self, request, **kwargs):
+        throttle = getattr(request, 'throttle', None)
+        if throttle != None:
+            throttle()
+        return super().send(request, **kwargs)
+
+class RevalidatingAdapter(CacheControlAdapter, ThrottledAdapter):
+    #CacheControl hands back the cached body for a 304 as if it never left the cache,
+    #mark those so they are not mistaken for hits that cost no request
+    def build_response(self, request, response, from_cache=False, cacheable_methods=None):
+        result = super().build_response(request, response, from_cache, cacheable_methods)
+        if not from_cache and response.status == 304:
+            result.revalidated = True
+        return result
+
+class HTTPClient():
+    #one pooled keep-alive session shared by every thread of a build, gzip on the wire,
+    #ETag/If-None-Match revalidation when a cache dir is given, and retries with
+    #exponential backoff and full jitter that wait at least as long as Retry-After.
+    #esi error-limit headers go to error_limit, which pauses the esi bucket every attempt waits on
+    def __init__(self, metrics, error_limit, cache_dir=None, pool_size=10, retries=4, backoff=1.0, max_backoff=60.0, timeout=(10, 60)):
+        self.metrics = metrics
+        self.error_limit = error_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.caching = cache_dir != None
+        if self.caching:
+            adapter = RevalidatingAdapter(cache=FileCache(cache_dir), cache_etags=True, pool_maxsize=pool_size)
+        else:
+            adapter = ThrottledAdapter(pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip'
+        self.session.headers['User-Agent'] = USER_AGENT
+
+    def get(self, url, family, bucket, stream=False):
+        return self.request('GET', url, family, bucket, stream=stream)
+
+    def post(self, url, family, bucket, payload):
+        return self.request('POST', url, family, bucket, json=payload)
+
+    def request(self, method, url, family, bucket, stream=False, **kwargs):
+        #returns the last response once it is not worth retrying, a connection error
+        #on the last attempt is raised
+        for attempt in range(self.retries + 1):
+            waits = []
+            prepared = self.session.prepare_request(requests.Request(method, url, **kwargs))
+            prepared.throttle = lambda: waits.append(self.wait_for(bucket, family))
+            settings = self.session.merge_environment_settings(prepared.url, {}, stream, None, None)
+            start = time.perf_counter()
+            try:
+                response = self.session.send(prepared, timeout=self.timeout, **settings)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                self.retry(attempt, url, family, None)
+                continue
+            if getattr(response, 'from_cache', False) and not getattr(response, 'revalidated', False):
+                self.metrics.inc('http_cache_total', family=family, result='hit')
+                return response
+            if self.caching and method == 'GET':
+                self.metrics.inc('http_cache_total', family=family, result='revalidated' if getattr(response, 'revalidated', False) else 'miss')
+            self.record(response, family, time.perf_counter() - start - sum(waits), stream)
+            self.error_limit.observe(response.headers)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            self.retry(attempt, url, family, response)
+            response.close()
+
+    def wait_for(self, bucket, family):
+        waited = bucket.acquire()
+        if waited:
+            self.metrics.inc('sleep_seconds_total', waited, reason=family+'_rate_limit')
+        return waited
+
+    def record(self, response, family, seconds, stream):
+        revalidated = getattr(response, 'revalidated', False)
+        self.metrics.inc('http_requests_total', family=family, status=304 if revalidated else response.status_code)
+        self.metrics.observe('http_request_seconds', seconds, family=family)
+        if not stream and not revalidated: #a 304 has no body, streamed ones are counted once read (zKillAPI.fetch_kill_details)
+            self.metrics.inc('http_response_bytes_total', wire_bytes(response), family=family)
+
+    def retry(self, attempt, url, family, response):
+        delay = self.retry_delay(attempt, response)
+        log.warning('retrying %s in %.1fs after %s', url, delay, 'a connection error' if response == None else 'a '+str(response.status_code)+' response')
+        self.metrics.inc('http_retries_total', family=family)
+        self.metrics.inc('sleep_seconds_total', delay, reason='backoff')
+        time.sleep(delay)
+
+    def retry_delay(self, attempt, response):
+        #full jitter: anywhere up to the exponential ceiling, so workers that failed
+        #together do not all come back at the same moment
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if response != None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after != None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def close(self):
+        self.session.close()
+
+def parse_retry_after(value):
+    #seconds to wait from a Retry-After header, which is either seconds or an http date
+    if value == None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo == None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+def wire_bytes(response):
+    #bytes as they came off the socket (before gzip is undone) where urllib3 tracks them
+    try:
+        return response.raw.tell() or len(response.content)
+    except (AttributeError, OSError):
+        return len(response.content)
@@ -0,0 +1,62 @@
+import json
+
+try:
+    import ijson
+except ImportError: # streaming is optional, without it the response is parsed whole and pruned straight away
+    ijson = None
+
+#fields dropped from a killmail as it arrives, the same ones stage_prune removes
+DROPPED_VICTIM_KEYS = frozenset(('damage_taken', 'items', 'position'))
+DROPPED_ATTACKER_KEYS = frozenset(('securityStatus', 'security_status', 'damage_done', 'ship_type_id', 'weapon_type_id'))
+DROPPED_TOP_LEVEL_KEYS = frozenset(('moonID', 'position'))
+
+def keep_attacker(attacker, our_ids):
+    return attacker.get('final_blow', False) or attacker.get('character_id') in our_ids
+
+def prune_killmail(raw, our_ids):
+    #prune an already parsed esi killmail down to what the board uses
+    mail = {key: value for key, value in raw.items() if key not in DROPPED_TOP_LEVEL_KEYS and key != 'attackers'}
+    mail['victim'] = {key: value for key, value in raw.get('victim', {}).items() if key not in DROPPED_VICTIM_KEYS}
+    attackers = raw.get('attackers', [])
+    mail['involved'] = len(attackers)
+    mail['attackers'] = []
+    for attacker in attackers:
+        if keep_attacker(attacker, our_ids):
+            attacker = {key: value for key, value in attacker.items() if key not in DROPPED_ATTACKER_KEYS}
+            mail['attackers'].append(attacker)
+            if attacker.get('final_blow', False):
+                mail['final_blow'] = attacker
+    return mail
+
+def parse_killmail(fp, our_ids):
+    #build the pruned killmail straight from the json event stream. only one attacker
+    #is held at a time, so memory stays flat however many pilots were on the fight
+    if ijson == None:
+        return prune_killmail(json.load(fp), our_ids)
+    mail = {'victim': {}, 'attackers': [], 'involved': 0}
+    attacker = None
+    for prefix, event, value in ijson.parse(fp, use_float=True):
+        if event in ('start_map', 'end_map', 'start_array', 'end_array', 'map_key'):
+            if prefix == 'attackers.item':
+                if event == 'start_map':
+                    attacker = {}
+                elif event == 'end_map':
+                    mail['involved'] += 1
+                    if keep_attacker(attacker, our_ids):
+                        mail['attackers'].append(attacker)
+                        if attacker.get('final_blow', False):
+                            mail['final_blow'] = attacker
+                    attacker = None
+            continue
+        #scalar values only from here on, anything nested deeper than one level is dropped
+        path = prefix.split('.')
+        if len(path) == 1:
+            if path[0] not in DROPPED_TOP_LEVEL_KEYS:
+                mail[path[0]] = value
+        elif path[0] == 'victim' and len(path) == 2:
+            if path[1] not in DROPPED_VICTIM_KEYS:
+                mail['victim'][path[1]] = value
+        elif path[0] == 'attackers' and len(path) == 3 and attacker != None:
+            if path[2] not in DROPPED_ATTACKER_KEYS:
+                attacker[path[2]] = value
+    return mail
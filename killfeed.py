@@ -0,0 +1,43 @@
+import logging
+from urllib.parse import quote
+
+from ratelimit import TokenBucket
+
+#zkill's push feed. each long poll returns {"package": {...}} with one kill, or
+#{"package": null} once ttw seconds pass without one. a package carries the killID, the
+#zkb block and either the full esi killmail (the classic format) or zkb.href, a link to it
+#that zKillAPI.ingest_package streams and prunes before filtering
+REDISQ_URL = 'https://redisq.zkillboard.com/listen.php'
+
+log = logging.getLogger('polyhedra')
+
+class KillFeed():
+    def __init__(self, http, url=REDISQ_URL, queue_id='polyhedra-board', ttw=10):
+        self.http = http
+        self.url = url
+        self.queue_id = queue_id
+        self.ttw = ttw
+        self.bucket = TokenBucket(rate=2, burst=1) # one poll in flight, never spin on errors
+
+    def listen(self):
+        #the next package, or None if the feed had nothing (or failed) this poll
+        url = self.url+'?queueID='+quote(self.queue_id)+'&ttw='+str(self.ttw)
+        response = self.http.get(url, 'redisq', self.bucket)
+        if response.ok == False:
+            log.warning('killfeed poll failed with %s', response.status_code)
+            return None
+        try:
+            return response.json().get('package')
+        except ValueError:
+            log.warning('killfeed returned something other than json')
+            return None
+
+def involves(killmail, our_ids):
+    #victim first, then one set lookup per attacker. nothing here grows with the number
+    #of characters we track
+    if killmail.get('victim', {}).get('character_id') in our_ids:
+        return True
+    for attacker in killmail.get('attackers', []):
+        if attacker.get('character_id') in our_ids:
+            return True
+    return False
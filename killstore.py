@@ -0,0 +1,151 @@
+import hashlib
+import json
+from collections import defaultdict
+
+from compact import CompactKillmail, as_dict, is_compact
+
+class KillmailStore():
+    #history container: a killmail_id hash index plus secondary indexes by day,
+    #row_type and involved (our) character. the secondary indexes are keyed on
+    #tags added after insert, so callers must reindex() a mail after tagging it.
+    #stages is the processing pipeline: mails whose 'pipeline' stamp does not match it
+    #are kept as plain dicts in a pending set until mark_processed(), every other mail is
+    #held as a CompactKillmail
+    def __init__(self, killmails=None, character_list=None, stages=()):
+        self.character_list = character_list or {}
+        self.current_stamp = dict(stages)
+        self.pending = set()
+        self.names_by_id = {theID: name for name, theID in self.character_list.items()}
+        self.by_id = {}
+        self.by_day = defaultdict(dict)
+        self.by_row_type = defaultdict(dict)
+        self.by_character = defaultdict(dict)
+        self.index_keys = {} #killmail_id -> (day, row_type, characters) it is currently filed under
+        self.dirty = set() #killmail_ids added or changed since the last save
+        self.version = 0 #bumped on every change, lets derived results tell when they are stale
+        self.digests = {} #killmail_id -> content hash of the processed mail, see digest()
+        for mail in killmails or []:
+            self.add(mail)
+        self.dirty.clear() #what we were built from is already saved
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return iter(self.by_id.values())
+
+    def __contains__(self, killmail_id):
+        return killmail_id in self.by_id
+
+    def get(self, killmail_id, default=None):
+        return self.by_id.get(killmail_id, default)
+
+    def add(self, mail):
+        #returns False if the killmail is already stored
+        if mail['killmail_id'] in self.by_id:
+            return False
+        if mail.get('pipeline') != self.current_stamp:
+            mail = as_dict(mail) # the stages edit plain dicts
+            self.pending.add(mail['killmail_id'])
+        elif not is_compact(mail):
+            mail = CompactKillmail(mail)
+        self.by_id[mail['killmail_id']] = mail
+        self.index_keys[mail['killmail_id']] = (None, None, ())
+        self.reindex(mail)
+        return True
+
+    def index_keys_for(self, mail):
+        day = mail['killmail_time'][0:10] if mail.get('killmail_time') else None
+        characters = list(mail.get('our_characters') or [])
+        #filed under the characters.json name like the attackers in our_characters, not the
+        #name esi has for the victim, which need not match it
+        victim_name = self.names_by_id.get((mail.get('victim') or {}).get('character_id'))
+        if victim_name != None:
+            characters.append(victim_name)
+        return (day, mail.get('row_type'), tuple(sorted(set(characters))))
+
+    def reindex(self, mail):
+        killmail_id = mail['killmail_id']
+        old_day, old_row_type, old_characters = self.index_keys[killmail_id]
+        day, row_type, characters = self.index_keys_for(mail)
+        if day != old_day:
+            self.move(self.by_day, old_day, day, mail)
+        if row_type != old_row_type:
+            self.move(self.by_row_type, old_row_type, row_type, mail)
+        if characters != old_characters:
+            for name in old_characters:
+                self.move(self.by_character, name, None, mail)
+            for name in characters:
+                self.move(self.by_character, None, name, mail)
+        self.index_keys[killmail_id] = (day, row_type, characters)
+        self.touch(mail)
+
+    def touch(self, mail):
+        #mark a mail as changed so the next save writes it
+        self.dirty.add(mail['killmail_id'])
+        self.version += 1
+        self.digests.pop(mail['killmail_id'], None)
+
+    def digest(self, killmail_id):
+        #taken once per processed mail, mails loaded as already processed get theirs on first use
+        if killmail_id not in self.digests:
+            self.digests[killmail_id] = mail_digest(self.by_id[killmail_id])
+        return self.digests[killmail_id]
+
+    def characters_of(self, killmail_id):
+        #names of our characters on a stored killmail, victim included
+        return self.index_keys[killmail_id][2]
+
+    def pending_mails(self):
+        return [self.by_id[x] for x in sorted(self.pending)]
+
+    def mark_processed(self, mail):
+        self.pending.discard(mail['killmail_id'])
+        self.reindex(mail)
+        self.replace(CompactKillmail(mail))
+        self.digests[mail['killmail_id']] = mail_digest(mail)
+
+    def replace(self, mail):
+        #swap in another object for the same killmail everywhere it is filed
+        killmail_id = mail['killmail_id']
+        self.by_id[killmail_id] = mail
+        day, row_type, characters = self.index_keys[killmail_id]
+        if day != None:
+            self.by_day[day][killmail_id] = mail
+        if row_type != None:
+            self.by_row_type[row_type][killmail_id] = mail
+        for name in characters:
+            self.by_character[name][killmail_id] = mail
+
+    def take_dirty(self):
+        mails = [self.by_id[x] for x in sorted(self.dirty) if x in self.by_id]
+        self.dirty.clear()
+        return mails
+
+    def move(self, index, old_key, new_key, mail):
+        if old_key != None:
+            bucket = index[old_key]
+            bucket.pop(mail['killmail_id'], None)
+            if not bucket:
+                del index[old_key]
+        if new_key != None:
+            index[new_key][mail['killmail_id']] = mail
+
+    def days(self):
+        return sorted(self.by_day.keys(), reverse=True)
+
+    def on_day(self, day):
+        return list(self.by_day.get(day, {}).values())
+
+    def with_row_type(self, row_type):
+        return list(self.by_row_type.get(row_type, {}).values())
+
+    def for_character(self, name):
+        return list(self.by_character.get(name, {}).values())
+
+    def to_list(self):
+        return [as_dict(mail) for mail in self.by_id.values()]
+
+def mail_digest(mail):
+    #the same for the same content whichever way the store was loaded
+    return hashlib.sha1(json.dumps(as_dict(mail), sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,134 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from fragments import write_if_changed
+
+#upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+PROMETHEUS_PREFIX = 'polyhedra_'
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+class Metrics():
+    #counters, latency histograms and stage timings for one build, safe to update from
+    #the fetch pool. written out as a json report and optionally a prometheus textfile
+    #  stage_seconds{stage}                    wall time of each build stage
+    #  http_requests_total{family,status}      calls per endpoint family (zkill, esi_killmails, esi_names, esi_lookup, redisq)
+    #  http_response_bytes_total{family}       response body bytes as received
+    #  http_request_seconds{family}            latency histogram
+    #  http_cache_total{family,result}         .web_cache hit, miss or revalidated (a 304 for an ETag)
+    #  http_retries_total{family}              attempts retried after a connection error or retryable status
+    #  lookup_total{table,result}              *_lookup table hit/miss, a miss is a per-id esi call
+    #  shared_fetch_total{kind}                 multi-board builds: killmails and zkill pages another board already fetched
+    #  static_data_total{category}            type and system names taken from the sde index (sde.py) instead of esi
+    #  sleep_seconds_total{reason}             time spent waiting on rate limits and retries
+    #  feed_packages_total{result}             daemon killfeed polls: ours, other, known or empty
+    #  feed_ingest_seconds                     daemon, from a package arriving to its pages being rewritten
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stages = {}
+        self.counters = defaultdict(lambda: defaultdict(float))
+        self.histograms = defaultdict(dict)
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[name][label_key(labels)] += value
+
+    def observe(self, name, value, **labels):
+        key = label_key(labels)
+        with self.lock:
+            histogram = self.histograms[name].get(key)
+            if histogram == None:
+                histogram = self.histograms[name][key] = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        #stages that run more than once in a build add up
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - start
+
+    def ratio(self, name, group, hit='hit'):
+        #hit ratio of a counter with a result label, per value of its group label
+        totals = defaultdict(lambda: [0.0, 0.0])
+        for key, value in self.counters[name].items():
+            labels = dict(key)
+            totals[labels.get(group)][0] += value if labels.get('result') == hit else 0
+            totals[labels.get(group)][1] += value
+        return {group_value: round(hits / total, 4) for group_value, (hits, total) in sorted(totals.items()) if total}
+
+    def report(self):
+        with self.lock:
+            counters = {name: [{'labels': dict(key), 'value': value} for key, value in sorted(values.items())]
+                        for name, values in sorted(self.counters.items())}
+            histograms = {}
+            for name, values in sorted(self.histograms.items()):
+                histograms[name] = []
+                for key, histogram in sorted(values.items()):
+                    histograms[name].append({'labels': dict(key),
+                                             'buckets': {format_bound(bound): count for bound, count in
+                                                         zip(LATENCY_BUCKETS, cumulative(histogram['buckets']))},
+                                             'sum': round(histogram['sum'], 6),
+                                             'count': histogram['count']})
+            stages = {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+        return {'started':    datetime.fromtimestamp(self.started, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'seconds':    round(time.time() - self.started, 3),
+                'stages':     stages,
+                'cache_hit_ratio':  self.ratio('http_cache_total', 'family'),
+                'lookup_hit_ratio': self.ratio('lookup_total', 'table'),
+                'counters':   counters,
+                'histograms': histograms}
+
+    def write_json(self, path):
+        write_if_changed(path, json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path):
+        #node_exporter textfile collector format, swapped in whole so a scrape never sees half a file
+        report = self.report()
+        lines = ['# TYPE '+PROMETHEUS_PREFIX+'stage_seconds gauge']
+        for stage, seconds in report['stages'].items():
+            lines.append(PROMETHEUS_PREFIX+'stage_seconds'+format_labels({'stage': stage})+' '+str(seconds))
+        for name, values in report['counters'].items():
+            lines.append('# TYPE '+PROMETHEUS_PREFIX+name+' counter')
+            for entry in values:
+                lines.append(PROMETHEUS_PREFIX+name+format_labels(entry['labels'])+' '+repr(float(entry['value'])))
+        for name, values in report['histograms'].items():
+            lines.append('# TYPE '+PROMETHEUS_PREFIX+name+' histogram')
+            for entry in values:
+                for bound, count in entry['buckets'].items():
+                    lines.append(PROMETHEUS_PREFIX+name+'_bucket'+format_labels(dict(entry['labels'], le=bound))+' '+str(count))
+                lines.append(PROMETHEUS_PREFIX+name+'_sum'+format_labels(entry['labels'])+' '+str(entry['sum']))
+                lines.append(PROMETHEUS_PREFIX+name+'_count'+format_labels(entry['labels'])+' '+str(entry['count']))
+        write_if_changed(path, '\n'.join(lines)+'\n')
+
+def cumulative(counts):
+    total = 0
+    result = []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+def format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(bound)
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{'+','.join(key+'="'+str(value).replace('\\', '\\\\').replace('"', '\\"')+'"' for key, value in sorted(labels.items()))+'}'
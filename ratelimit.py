@@ -0,0 +1,59 @@
+import threading
+import time
+
+class TokenBucket():
+    #thread-safe token bucket shared by every worker calling one api.
+    #rate is tokens per second, burst is how many can be spent back to back
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        #block until a token is available, returns the seconds spent waiting
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        #stop handing out tokens to every thread for the next few seconds
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class ESIErrorLimit():
+    #esi allows a fixed number of 4xx/5xx responses per window and bans the ip past it.
+    #each response reports what is left, so stop all esi traffic when we run low
+    def __init__(self, bucket, floor=10):
+        self.bucket = bucket
+        self.floor = floor
+
+    def observe(self, headers):
+        remain = headers.get('X-Esi-Error-Limit-Remain')
+        reset = headers.get('X-Esi-Error-Limit-Reset')
+        if remain == None or reset == None:
+            return
+        try:
+            remain = int(remain)
+            reset = int(reset)
+        except ValueError:
+            return
+        if remain <= self.floor:
+            self.bucket.pause(reset + 1)
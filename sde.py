@@ -0,0 +1,118 @@
+import bz2
+import csv
+import io
+import logging
+import os
+import sqlite3
+import sys
+
+#offline names for the static data esi would otherwise be asked about one id at a time:
+#inventory types with their group and solar systems with their region, built from
+#fuzzwork's csv conversion of the eve static data export
+#  python sde.py <dir with invTypes, invGroups, mapSolarSystems, mapRegions .csv or .csv.bz2> [out=data/sde.sqlite]
+#zKillAPI opens the index read-only and memory-mapped when it exists and only falls back
+#to esi for ids newer than the dump
+
+SDE_PATH = 'data/sde.sqlite'
+SDE_TABLES = ('invTypes', 'invGroups', 'mapSolarSystems', 'mapRegions')
+SCHEMA_VERSION = 1
+MMAP_SIZE = 64 * 1024 * 1024
+
+log = logging.getLogger('polyhedra')
+
+class StaticData():
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect('file:'+path+'?mode=ro', uri=True, check_same_thread=False)
+        self.conn.execute('PRAGMA mmap_size='+str(MMAP_SIZE))
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            raise ValueError(path+' has schema version '+str(version)+', expected '+str(SCHEMA_VERSION)+'. rebuild it with sde.py')
+
+    @classmethod
+    def open(cls, path):
+        #None when no index has been built, every lookup then goes to esi as before
+        if path == None or not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except (sqlite3.Error, ValueError) as error:
+            log.warning('ignoring static data index: %s', error)
+            return None
+
+    def type_name(self, theID):
+        row = self.conn.execute('SELECT name FROM types WHERE type_id = ?', (int(theID),)).fetchone()
+        return None if row == None else row[0]
+
+    def system_name(self, theID):
+        row = self.conn.execute('SELECT name FROM systems WHERE system_id = ?', (int(theID),)).fetchone()
+        return None if row == None else row[0]
+
+    def close(self):
+        self.conn.close()
+
+def read_table(sde_dir, table):
+    #rows of one fuzzwork csv as dicts, compressed or not
+    path = os.path.join(sde_dir, table+'.csv')
+    if os.path.exists(path+'.bz2'):
+        fd = io.TextIOWrapper(bz2.open(path+'.bz2', 'rb'), encoding='utf-8', newline='')
+    else:
+        fd = open(path, 'r', encoding='utf-8', newline='')
+    with fd:
+        for row in csv.DictReader(fd):
+            yield row
+
+def build_index(sde_dir, path):
+    #written next to the target and swapped in, a build reading the old index never sees half a new one
+    groups = {int(row['groupID']): row['groupName'] for row in read_table(sde_dir, 'invGroups')}
+    regions = {int(row['regionID']): row['regionName'] for row in read_table(sde_dir, 'mapRegions')}
+    temp_path = path+'.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    conn = sqlite3.connect(temp_path)
+    conn.execute('''CREATE TABLE types (
+                        type_id    INTEGER PRIMARY KEY,
+                        name       TEXT NOT NULL,
+                        group_name TEXT)''')
+    conn.execute('''CREATE TABLE systems (
+                        system_id   INTEGER PRIMARY KEY,
+                        name        TEXT NOT NULL,
+                        region_name TEXT,
+                        security    REAL)''')
+    with conn:
+        conn.executemany('INSERT INTO types VALUES (?, ?, ?)',
+                         ((int(row['typeID']), row['typeName'], groups.get(int(row['groupID'])))
+                          for row in read_table(sde_dir, 'invTypes') if row['typeName']))
+        conn.executemany('INSERT INTO systems VALUES (?, ?, ?, ?)',
+                         ((int(row['solarSystemID']), row['solarSystemName'], regions.get(int(row['regionID'])), parse_security(row['security']))
+                          for row in read_table(sde_dir, 'mapSolarSystems')))
+    conn.execute('PRAGMA user_version='+str(SCHEMA_VERSION))
+    counts = [conn.execute('SELECT COUNT(*) FROM '+table).fetchone()[0] for table in ('types', 'systems')]
+    conn.execute('VACUUM')
+    conn.close()
+    os.replace(temp_path, path)
+    return counts
+
+def parse_security(value):
+    try:
+        return round(float(value), 4)
+    except (TypeError, ValueError):
+        return None
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    args = sys.argv[1:]
+    sde_dir = None
+    path = SDE_PATH
+    for arg in args:
+        if arg.startswith('out='):
+            path = arg[len('out='):]
+        else:
+            sde_dir = arg
+    if sde_dir == None:
+        sys.exit('usage: python sde.py <fuzzwork csv dir> [out='+SDE_PATH+']')
+    missing = [table for table in SDE_TABLES if not os.path.exists(os.path.join(sde_dir, table+'.csv')) and not os.path.exists(os.path.join(sde_dir, table+'.csv.bz2'))]
+    if missing:
+        sys.exit('missing from '+sde_dir+': '+', '.join(x+'.csv' for x in missing))
+    types, systems = build_index(sde_dir, path)
+    log.info('%s: %d types, %d solar systems, %d bytes', path, types, systems, os.path.getsize(path))
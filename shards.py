@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None # .br files are skipped without it, gzip is always written
+
+#the data api behind the client rendered board (templates/board.html, static/js/board.js):
+#  manifest.json            board name, totals, views, characters and the file of every month
+#  months/YYYY-MM.<hash>.json   that month's killmails, newest first
+#every file but the manifest has a hash of its bytes in its name, so a deploy only adds
+#files for months whose killmails changed and browsers can keep the rest for good.
+#each file also gets .gz and .br siblings for servers that send precompressed files
+#(nginx gzip_static/brotli_static) instead of compressing on every request
+
+HASH_LENGTH = 12
+ENCODINGS = ('gz', 'br') if brotli != None else ('gz',)
+
+#the fields day.html shows, the client renders the same rows from them
+VICTIM_FIELDS = ('character_id', 'character_name', 'alliance_id', 'alliance_name', 'ship_type_id', 'ship_type_name')
+FINAL_BLOW_FIELDS = ('character_id', 'character_name', 'alliance_id', 'alliance_name')
+
+#compressed bytes by content hash, so unchanged files are not compressed again on a rebuild
+compressed_cache = {}
+
+def content_name(name, data):
+    #'months/2024-05.json' -> 'months/2024-05.<hash>.json'
+    root, ext = os.path.splitext(name)
+    return root+'.'+hashlib.sha1(data).hexdigest()[:HASH_LENGTH]+ext
+
+def compress(data, encoding):
+    key = (hashlib.sha1(data).digest(), encoding)
+    result = compressed_cache.get(key)
+    if result == None:
+        if encoding == 'gz':
+            result = gzip.compress(data, compresslevel=9, mtime=0) # no timestamp, same bytes every build
+        else:
+            result = brotli.compress(data, quality=11)
+        compressed_cache[key] = result
+    return result
+
+def encode(value):
+    return json.dumps(value, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+def add_file(files, name, data):
+    files[name] = data
+    for encoding in ENCODINGS:
+        files[name+'.'+encoding] = compress(data, encoding)
+
+def shard_row(mail, view_names):
+    victim = mail.get('victim') or {}
+    final_blow = mail.get('final_blow') or {}
+    return {'killmail_id':       mail['killmail_id'],
+            'killmail_time':     mail['killmail_time'],
+            'row_type':          mail.get('row_type'),
+            'formatted_price':   mail.get('formatted_price'),
+            'solar_system_id':   mail.get('solar_system_id'),
+            'solar_system_name': mail.get('solar_system_name'),
+            'victim':            {key: victim.get(key) for key in VICTIM_FIELDS},
+            'final_blow':        {key: final_blow.get(key) for key in FINAL_BLOW_FIELDS},
+            'involved':          mail.get('involved'),
+            'our_characters':    list(mail.get('our_characters') or []),
+            'views':             view_names}
+
+class DataAPI():
+    #every file of the data api by path, from one scan of history. views maps a view name to
+    #its predicate, board is the manifest's board information (name, totals, views, characters)
+    def __init__(self, history, views, board, format_month):
+        self.history = history
+        self.version = history.version
+        months = defaultdict(list)
+        view_predicates = list(views.items())
+        for mail in history:
+            if not mail.get('killmail_time'):
+                continue
+            view_names = [name for name, predicate in view_predicates if predicate(mail)]
+            if view_names:
+                months[mail['killmail_time'][0:7]].append(shard_row(mail, view_names))
+        self.files = {}
+        manifest_months = []
+        for month in sorted(months, reverse=True):
+            rows = sorted(months[month], key=lambda x: (x['killmail_time'], x['killmail_id']), reverse=True)
+            data = encode(rows)
+            name = content_name('months/'+month+'.json', data)
+            add_file(self.files, name, data)
+            manifest_months.append({'month': month, 'label': format_month(month), 'count': len(rows), 'file': name})
+        add_file(self.files, 'manifest.json', encode(dict(board, months=manifest_months)))
+
+    def is_current(self, history):
+        return history is self.history and history.version == self.version
+
+class StaticAssets():
+    #the files under static/ by content hashed path, with their compressed siblings.
+    #names maps a plain static path to its hashed one for asset_url() in the templates
+    def __init__(self, static_dir):
+        self.files = {}
+        self.names = {}
+        for root, dirs, filenames in os.walk(static_dir):
+            dirs.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, static_dir).replace(os.sep, '/')
+                with open(path, 'rb') as fd:
+                    data = fd.read()
+                self.names[name] = content_name(name, data)
+                add_file(self.files, self.names[name], data)
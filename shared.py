@@ -0,0 +1,35 @@
+import threading
+
+from ratelimit import TokenBucket, ESIErrorLimit
+from metrics import Metrics
+from http_client import HTTPClient
+from sqlstore import LOOKUP_TABLES
+
+class SharedResources():
+    #what every board of a build talks to the apis through: one keep-alive session, one set
+    #of rate limits and one metrics report. a single board build has its own; a multi-board
+    #build (boards=FILE) hands one to every zKillAPI, which then also shares its name lookup
+    #tables and reuses esi killmails and zkill pages another board already fetched this build
+    def __init__(self, do_file_cache, workers=8, multi_board=False):
+        # 'be polite' with requests: zkill asks for about one call a second,
+        # esi has no fixed rate but bans on errors so watch its error limit headers
+        self.zkill_bucket = TokenBucket(rate=1, burst=1)
+        self.esi_bucket = TokenBucket(rate=20, burst=20)
+        self.esi_error_limit = ESIErrorLimit(self.esi_bucket)
+        self.metrics = Metrics()
+        #one keep-alive pool for every fetch worker, .web_cache revalidates with ETags
+        self.http = HTTPClient(self.metrics, self.esi_error_limit, '.web_cache' if do_file_cache else None,
+                               pool_size=max(workers, 10))
+        self.multi_board = multi_board
+        self.our_ids = frozenset() #every board's characters, killmails are parsed keeping all of their attackers
+        self.lookups = {lookup: {} for lookup in LOOKUP_TABLES}
+        self.killmails = {} #killmail_id -> parsed esi killmail, never handed out without a copy
+        self.zkill_pages = {} #url -> zkill page body
+        self.lock = threading.Lock()
+
+    def add_board(self, our_ids, lookups):
+        #a board's characters and the lookup tables it loaded, merged into the shared ones
+        with self.lock:
+            self.our_ids = self.our_ids | our_ids
+            for lookup, table in lookups.items():
+                self.lookups[lookup].update(table)
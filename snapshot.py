@@ -0,0 +1,93 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+from fragments import write_if_changed
+
+#the processed state of a build in one local file, so the next start skips parsing
+#history.json and the lookup tables:
+#  MAGIC, a json header line {version, sources, sections: name -> [offset, length]}, sha256 of
+#  the sections, then one pickle per section
+#the whole file is read and checked at once, sections are only unpickled when asked for.
+#sources fingerprints the json files the state was saved to; if any of them changed since
+#(a checkout of the gh-pages data, a hand edit) the snapshot is stale and the json is loaded instead.
+#with sqlite the database's write generation is fingerprinted in place of the json files
+#pickles run code when loaded, the file is kept out of git (.gitignore) and never published
+
+MAGIC = b'polyhedra-snapshot\n'
+SCHEMA_VERSION = 5
+
+log = logging.getLogger('polyhedra')
+
+class Snapshot():
+    def __init__(self, data, header):
+        self.data = data
+        self.header = header
+        self.loaded = {}
+
+    @classmethod
+    def read(cls, path, sources):
+        #the snapshot at path, or None (and why, in the log) if it is missing, stale or corrupt
+        try:
+            with open(path, 'rb') as fd:
+                data = fd.read()
+        except FileNotFoundError:
+            return None
+        problem = check(data, sources)
+        if problem != None:
+            log.warning('ignoring snapshot %s: %s', path, problem)
+            return None
+        header_end = data.index(b'\n', len(MAGIC))
+        return cls(memoryview(data)[header_end + 1 + 32:], json.loads(data[len(MAGIC):header_end]))
+
+    def __contains__(self, name):
+        return name in self.header['sections']
+
+    def load(self, name):
+        if name not in self.loaded:
+            offset, length = self.header['sections'][name]
+            self.loaded[name] = pickle.loads(self.data[offset:offset + length])
+        return self.loaded[name]
+
+def check(data, sources):
+    if not data.startswith(MAGIC):
+        return 'not a snapshot'
+    header_end = data.find(b'\n', len(MAGIC))
+    if header_end == -1:
+        return 'truncated'
+    try:
+        header = json.loads(data[len(MAGIC):header_end])
+    except ValueError:
+        return 'unreadable header'
+    if header.get('version') != SCHEMA_VERSION:
+        return 'schema version '+str(header.get('version'))+', expected '+str(SCHEMA_VERSION)
+    digest = data[header_end + 1:header_end + 1 + 32]
+    if hashlib.sha256(memoryview(data)[header_end + 1 + 32:]).digest() != digest:
+        return 'checksum mismatch'
+    if header.get('sources') != sources:
+        return 'the saved state changed since it was written'
+    return None
+
+def write_snapshot(path, sections, sources):
+    #sections is name -> object. swapped in whole, a crash mid-write leaves the previous snapshot
+    body = bytearray()
+    offsets = {}
+    for name, value in sections.items():
+        pickled = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        offsets[name] = [len(body), len(pickled)]
+        body += pickled
+    header = json.dumps({'version': SCHEMA_VERSION, 'sources': sources, 'sections': offsets}, sort_keys=True).encode()
+    write_if_changed(path, MAGIC + header + b'\n' + hashlib.sha256(body).digest() + bytes(body))
+
+def fingerprint(paths):
+    #size and modification time of each file the state is saved to, None if it does not exist
+    result = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            result[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            result[os.path.basename(path)] = None
+    return result
@@ -0,0 +1,100 @@
+import json
+import sqlite3
+
+from compact import as_dict
+
+LOOKUP_TABLES = ('ship_lookup', 'solarsystem_lookup', 'character_lookup', 'corp_lookup', 'alliance_lookup')
+
+class SqliteStore():
+    #optional persistent backend for history and the ID/name lookup tables.
+    #writes are upserts inside one transaction, so a crash mid-write leaves the last good state.
+    #every write also bumps a generation number, which is what a state snapshot of the
+    #database is checked against (writes from outside this class are not noticed)
+    def __init__(self, path):
+        self.path = path
+        self.saved_ids = {} # lookup -> ids already in the database
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS killmails (
+                                 killmail_id   INTEGER PRIMARY KEY,
+                                 killmail_time TEXT,
+                                 row_type      TEXT,
+                                 body          TEXT NOT NULL)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS killmails_time ON killmails (killmail_time)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS killmails_row_type ON killmails (row_type)')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS lookups (
+                                 lookup TEXT NOT NULL,
+                                 id     TEXT NOT NULL,
+                                 name   TEXT NOT NULL,
+                                 PRIMARY KEY (lookup, id))''')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS meta (
+                                 key   TEXT PRIMARY KEY,
+                                 value INTEGER NOT NULL)''')
+        self.conn.commit()
+
+    def is_empty(self):
+        return self.conn.execute('SELECT COUNT(*) FROM killmails').fetchone()[0] == 0
+
+    def load_killmails(self):
+        return [json.loads(body) for (body,) in self.conn.execute('SELECT body FROM killmails ORDER BY killmail_id')]
+
+    def load_lookup(self, lookup):
+        table = {theID: name for theID, name in self.conn.execute('SELECT id, name FROM lookups WHERE lookup = ?', (lookup,))}
+        self.saved_ids[lookup] = set(table)
+        return table
+
+    def generation(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return 0 if row == None else row[0]
+
+    def bump_generation(self):
+        self.conn.execute('''INSERT INTO meta (key, value) VALUES ('generation', 1)
+                             ON CONFLICT (key) DO UPDATE SET value = value + 1''')
+
+    def upsert_killmails(self, mails):
+        if len(mails) == 0:
+            return
+        rows = ((mail['killmail_id'], mail.get('killmail_time'), mail.get('row_type'), json.dumps(as_dict(mail))) for mail in mails)
+        with self.conn:
+            self.bump_generation()
+            self.conn.executemany('''INSERT INTO killmails (killmail_id, killmail_time, row_type, body)
+                                     VALUES (?, ?, ?, ?)
+                                     ON CONFLICT (killmail_id) DO UPDATE SET
+                                         killmail_time = excluded.killmail_time,
+                                         row_type      = excluded.row_type,
+                                         body          = excluded.body
+                                     WHERE body != excluded.body''', rows)
+
+    def upsert_lookup(self, lookup, table):
+        #ids are only ever added to a lookup table, a name once resolved is kept, so only
+        #the ids the database does not have yet are written
+        if lookup not in self.saved_ids:
+            self.saved_ids[lookup] = set(theID for (theID,) in self.conn.execute('SELECT id FROM lookups WHERE lookup = ?', (lookup,)))
+        saved = self.saved_ids[lookup]
+        new_ids = [theID for theID in table if theID not in saved]
+        if len(new_ids) == 0:
+            return
+        with self.conn:
+            self.bump_generation()
+            self.conn.executemany('''INSERT INTO lookups (lookup, id, name) VALUES (?, ?, ?)
+                                     ON CONFLICT (lookup, id) DO UPDATE SET name = excluded.name
+                                     WHERE name != excluded.name''',
+                                  ((lookup, theID, table[theID]) for theID in new_ids))
+        saved.update(new_ids)
+
+    def import_json(self, data_dir):
+        #one-off migration from the json files write_data_to_file has always produced
+        try:
+            with open(data_dir + '/history.json', 'r') as fd:
+                self.upsert_killmails(json.load(fd))
+        except FileNotFoundError:
+            pass
+        for lookup in LOOKUP_TABLES:
+            try:
+                with open(data_dir + '/' + lookup + '.json', 'r') as fd:
+                    self.upsert_lookup(lookup, json.load(fd))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,214 @@
+// client rendered board (/board/): reads the data api manifest and renders its month
+// shards newest first, the same rows as templates/day.html. the most recent days are shown
+// straight away and older months are fetched as the end of the table scrolls into view.
+//   ?view=<name>        one of the board views, all kills by default
+//   ?character=<name>   one of our characters
+
+var MONTH_NAMES = ['', 'January', 'February', 'March', 'April', 'May', 'June', 'July',
+                   'August', 'September', 'October', 'November', 'December'];
+
+function escapeHtml(value) {
+    if (value === null || value === undefined) {
+        return '';
+    }
+    return String(value).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+                        .replace(/"/g, '&quot;').replace(/'/g, '&#39;');
+}
+
+function formatDate(day) {
+    return MONTH_NAMES[parseInt(day.substring(5, 7), 10)] + ' ' + parseInt(day.substring(8, 10), 10) + ', ' + parseInt(day.substring(0, 4), 10);
+}
+
+function dayRow(day) {
+    return '<tr class="kb-table-row-date" id="day-' + day + '"><th colspan="8" class="row-date">' + formatDate(day) + '</th></tr>';
+}
+
+function killmailRow(mail) {
+    var kill = 'https://zkillboard.com/kill/' + mail.killmail_id + '/';
+    var victim = mail.victim;
+    var finalBlow = mail.final_blow;
+    return '<tr class="' + escapeHtml(mail.row_type) + '">' +
+        '<td class="time-price">' + mail.killmail_time.substring(11, 16) + '<br>' +
+            '<a href="' + kill + '">' + escapeHtml(mail.formatted_price) + '</a></td>' +
+        '<td class="ship-icon"><a href="' + kill + '"><img src="https://imageserver.eveonline.com/Type/' + escapeHtml(victim.ship_type_id) + '_64.png"' +
+            ' height="40" width="40" alt="(' + escapeHtml(victim.ship_type_name) + ')"></a></td>' +
+        '<td class="solar-system"><a href="https://zkillboard.com/system/' + escapeHtml(mail.solar_system_id) + '/">' + escapeHtml(mail.solar_system_name) + '</a></td>' +
+        '<td class="pilot-info">' +
+            '<a href="https://zkillboard.com/alliance/' + escapeHtml(victim.alliance_id) + '/"><img src="https://image.eveonline.com/Alliance/' + escapeHtml(victim.alliance_id) + '_64.png"' +
+            ' height="40" width="40" alt="' + escapeHtml(victim.alliance_name) + '"></a>' +
+            '<span class="name"><a href="https://zkillboard.com/character/' + escapeHtml(victim.character_id) + '/">' + escapeHtml(victim.character_name) + '</a> ' +
+            '<span class="greytext">(' + escapeHtml(victim.ship_type_name) + ')</span>' +
+            '<br><small><a href="https://zkillboard.com/alliance/' + escapeHtml(victim.alliance_id) + '/">' + escapeHtml(victim.alliance_name) + '</a></small></span></td>' +
+        '<td class="final-blow-info">' +
+            '<a href="https://zkillboard.com/alliance/' + escapeHtml(finalBlow.alliance_id) + '/"><img src="https://imageserver.eveonline.com/Alliance/' + escapeHtml(finalBlow.alliance_id) + '_64.png"' +
+            ' height="40" width="40" alt="' + escapeHtml(finalBlow.alliance_name) + '"></a>' +
+            '<span class="name"><a href="https://zkillboard.com/character/' + escapeHtml(finalBlow.character_id) + '/">' + escapeHtml(finalBlow.character_name) + '</a> ' +
+            '<span class="greytext">(' + escapeHtml(mail.involved) + ')</span><br>' +
+            '<small><a href="https://zkillboard.com/alliance/' + escapeHtml(finalBlow.alliance_id) + '/">' + escapeHtml(finalBlow.alliance_name) + '</a></small></span></td>' +
+        '<td class="involved-info"><small>' + mail.our_characters.map(escapeHtml).join('<br>') + '</small></td>' +
+        '</tr>';
+}
+
+function linkRow(href, text) {
+    return '<tr><th><a href="' + escapeHtml(href) + '">' + escapeHtml(text) + '</a></th></tr>';
+}
+
+function Board(table, manifestUrl, params) {
+    this.table = table;
+    this.manifestUrl = manifestUrl;
+    this.more = document.getElementById('kb-more');
+    this.viewName = params.get('view') || 'all';
+    this.characterName = params.get('character');
+    this.nextMonth = 0;
+    this.lastDay = null;
+    this.days = 0;
+    this.loading = null;
+}
+
+Board.prototype.start = function () {
+    var board = this;
+    return fetch(this.manifestUrl, {cache: 'no-cache'}).then(function (response) {
+        return response.json();
+    }).then(function (manifest) {
+        board.manifest = manifest;
+        board.renderSidebar();
+        return board.loadUntil(function () { return board.days >= manifest.front_page_days; });
+    }).then(function () {
+        board.watchScroll();
+    });
+};
+
+Board.prototype.renderSidebar = function () {
+    var manifest = this.manifest;
+    var title = manifest.board_name;
+    var totals = manifest.totals;
+    var board = this;
+    if (this.characterName) {
+        manifest.characters.forEach(function (character) {
+            if (character.name === board.characterName) {
+                board.character = character;
+            }
+        });
+        title = this.characterName;
+        totals = this.character ? this.character.totals : {};
+    } else {
+        manifest.views.forEach(function (view) {
+            if (view.name === board.viewName) {
+                title = manifest.board_name + view.board_suffix;
+            }
+        });
+    }
+    document.getElementById('board-name').textContent = title;
+    ['kills', 'losses', 'friendly_fire', 'money_killed', 'money_lost'].forEach(function (key) {
+        document.getElementById('total-' + key).textContent = totals[key] === undefined ? '' : totals[key];
+    });
+    document.getElementById('kb-views').insertAdjacentHTML('beforeend', manifest.views.map(function (view) {
+        return linkRow('?view=' + encodeURIComponent(view.name), view.title);
+    }).join(''));
+    document.getElementById('kb-characters').insertAdjacentHTML('beforeend', manifest.characters.map(function (character) {
+        return linkRow('?character=' + encodeURIComponent(character.name), character.name);
+    }).join(''));
+    var archive = document.getElementById('kb-archive');
+    archive.insertAdjacentHTML('beforeend', manifest.months.map(function (month) {
+        return linkRow('#month-' + month.month, month.label);
+    }).join(''));
+    archive.addEventListener('click', function (event) {
+        var target = event.target.getAttribute('href');
+        if (target && target.indexOf('#month-') === 0) {
+            event.preventDefault();
+            board.showMonth(target.substring('#month-'.length));
+        }
+    });
+};
+
+Board.prototype.matches = function (mail) {
+    if (this.characterName) {
+        return mail.our_characters.indexOf(this.characterName) !== -1 ||
+               (this.character !== undefined && mail.victim.character_id === this.character.id);
+    }
+    return mail.views.indexOf(this.viewName) !== -1;
+};
+
+Board.prototype.loadMonth = function () {
+    // fetch and render the next older month, resolves false once there are none left
+    var board = this;
+    if (this.nextMonth >= this.manifest.months.length) {
+        this.more.innerHTML = '';
+        return Promise.resolve(false);
+    }
+    if (this.loading) {
+        return this.loading;
+    }
+    var month = this.manifest.months[this.nextMonth];
+    this.loading = fetch(new URL(month.file, new URL(this.manifestUrl, window.location.href))).then(function (response) {
+        return response.json();
+    }).then(function (mails) {
+        var html = '<tr id="month-' + month.month + '"></tr>';
+        mails.forEach(function (mail) {
+            if (!board.matches(mail)) {
+                return;
+            }
+            var day = mail.killmail_time.substring(0, 10);
+            if (day !== board.lastDay) {
+                html += dayRow(day);
+                board.lastDay = day;
+                board.days += 1;
+            }
+            html += killmailRow(mail);
+        });
+        board.table.insertAdjacentHTML('beforeend', html);
+        board.nextMonth += 1;
+        board.loading = null;
+        return true;
+    });
+    return this.loading;
+};
+
+Board.prototype.loadUntil = function (done) {
+    var board = this;
+    if (done()) {
+        return Promise.resolve();
+    }
+    return this.loadMonth().then(function (more) {
+        return more ? board.loadUntil(done) : undefined;
+    });
+};
+
+Board.prototype.showMonth = function (month) {
+    var board = this;
+    var index = this.manifest.months.map(function (x) { return x.month; }).indexOf(month);
+    this.loadUntil(function () { return board.nextMonth > index; }).then(function () {
+        var row = document.getElementById('month-' + month);
+        if (row) {
+            row.scrollIntoView();
+        }
+    });
+};
+
+Board.prototype.watchScroll = function () {
+    var board = this;
+    if (!('IntersectionObserver' in window)) {
+        this.loadUntil(function () { return false; }); // no observer, just load everything
+        return;
+    }
+    // observing again after each month fires straight away if the end is still in view
+    var observer = new IntersectionObserver(function (entries) {
+        if (entries[0].isIntersecting) {
+            observer.unobserve(board.more);
+            board.loadMonth().then(function (more) {
+                if (more) {
+                    observer.observe(board.more);
+                }
+            });
+        }
+    }, {rootMargin: '800px'});
+    observer.observe(this.more);
+};
+
+(function () {
+    var table = document.getElementById('kb-rows');
+    if (table === null) {
+        return;
+    }
+    new Board(table, table.getAttribute('data-manifest'), new URLSearchParams(window.location.search)).start();
+})();
@@ -0,0 +1,64 @@
+import json
+
+#a view's route is a single path segment such as /target_ships/ (or / for the main board)
+#filters a view in data/views.json may set. list-valued filters take either an
+#inline json list or the name of a json file under data/ holding that list
+#  row_types                  row_type tags to keep (row-kill, row-loss, row-friendly_fire)
+#  victim_alliances           keep only victims in these alliances
+#  exclude_victim_alliances   drop victims in these alliances
+#  victim_ship_types          keep only victims flying these type ids
+#  exclude_victim_ship_types  drop victims flying these type ids
+#  final_blow_by_us           keep only mails one of our characters finished
+#  date_from, date_to         inclusive YYYY-MM-DD bounds on killmail_time
+
+def load_views(data_dir, character_list):
+    with open(data_dir + '/views.json', 'r') as fd:
+        views = json.load(fd)
+    for view in views:
+        view.setdefault('enabled', True)
+        view.setdefault('board_suffix', '')
+        view['predicate'] = compile_filters(view.get('filters', {}), data_dir, character_list)
+    #the main board (index, totals, the data api) is the / view, so there has to be one
+    if not any(view['enabled'] and view['route'] == '/' for view in views):
+        raise ValueError('load_views: '+data_dir+'/views.json has no enabled view with the route "/" for the main board')
+    return views
+
+def load_id_list(value, data_dir):
+    if isinstance(value, str):
+        with open(data_dir + '/' + value, 'r') as fd:
+            value = json.load(fd)
+    return frozenset(value)
+
+def compile_filters(filters, data_dir, character_list):
+    #turn the declarative filters into one closure over precomputed sets,
+    #checked cheapest first so most mails are rejected after one lookup
+    checks = []
+    if 'row_types' in filters:
+        row_types = frozenset(filters['row_types'])
+        checks.append(lambda mail: mail.get('row_type') in row_types)
+    if 'date_from' in filters:
+        date_from = filters['date_from']
+        checks.append(lambda mail: mail['killmail_time'][0:10] >= date_from)
+    if 'date_to' in filters:
+        date_to = filters['date_to']
+        checks.append(lambda mail: mail['killmail_time'][0:10] <= date_to)
+    if 'victim_alliances' in filters:
+        alliances = load_id_list(filters['victim_alliances'], data_dir)
+        checks.append(lambda mail: mail['victim'].get('alliance_id', 0) in alliances)
+    if 'exclude_victim_alliances' in filters:
+        excluded_alliances = load_id_list(filters['exclude_victim_alliances'], data_dir)
+        checks.append(lambda mail: mail['victim'].get('alliance_id', 0) not in excluded_alliances)
+    if 'victim_ship_types' in filters:
+        ship_types = load_id_list(filters['victim_ship_types'], data_dir)
+        checks.append(lambda mail: mail['victim'].get('ship_type_id', 0) in ship_types)
+    if 'exclude_victim_ship_types' in filters:
+        excluded_ship_types = load_id_list(filters['exclude_victim_ship_types'], data_dir)
+        checks.append(lambda mail: mail['victim'].get('ship_type_id', 0) not in excluded_ship_types)
+    if filters.get('final_blow_by_us', False):
+        our_ids = frozenset(character_list.values())
+        checks.append(lambda mail: mail.get('final_blow', {}).get('character_id') in our_ids)
+    if not checks:
+        return lambda mail: True
+    if len(checks) == 1:
+        return checks[0]
+    return lambda mail: all(check(mail) for check in checks)